@@ -1,4 +1,3 @@
-print("=== sibyllai_core __init__.py LOADED ===")
 "Public API"
 from .pipeline import analyse as run
 
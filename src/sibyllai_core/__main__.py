@@ -1,2 +1,2 @@
 from .cli import main
-main()            # pragma: no cover
+raise SystemExit(main())  # pragma: no cover
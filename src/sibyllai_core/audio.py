@@ -0,0 +1,174 @@
+"In-memory audio buffer handed between pipeline stages."
+from __future__ import annotations
+import shutil, subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+_LAYOUTS = {1: "mono", 2: "stereo"}
+
+
+@dataclass(frozen=True)
+class AudioBuffer:
+    "Float32 samples shaped (channels, frames) at sample rate *sr*."
+    samples: np.ndarray
+    sr: int
+    # resampled copies of this buffer keyed by rate, filled by at_rate()
+    _rates: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    @classmethod
+    def from_array(cls, y, sr: int) -> "AudioBuffer":
+        """
+        Wrap *y* without copying where possible. 1-D arrays are mono,
+        2-D arrays are (channels, frames) or (frames, channels) as returned
+        by ``soundfile.read`` – the shorter axis is taken as channels.
+        """
+        y = np.asarray(y, dtype=np.float32)
+        if y.ndim == 1:
+            y = y[np.newaxis, :]
+        elif y.ndim == 2 and y.shape[0] > y.shape[1]:
+            y = y.T
+        elif y.ndim != 2:
+            raise ValueError(f"Unexpected audio shape {y.shape}")
+        return cls(y, int(sr))
+
+    @property
+    def channels(self) -> int:
+        return self.samples.shape[0]
+
+    @property
+    def layout(self) -> str:
+        return _LAYOUTS.get(self.channels, f"{self.channels}ch")
+
+    @property
+    def frames(self) -> int:
+        return self.samples.shape[1]
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.sr
+
+    def mono(self) -> np.ndarray:
+        "1-D view (or channel mean) of the samples."
+        if self.channels == 1:
+            return self.samples[0]
+        return self.samples.mean(axis=0)
+
+    def stereo(self) -> np.ndarray:
+        "(2, frames) array; mono is duplicated, extra channels are dropped."
+        if self.channels == 1:
+            return np.broadcast_to(self.samples, (2, self.frames))
+        return self.samples[:2]
+
+    def to_mono(self) -> "AudioBuffer":
+        "Mono buffer (self when already mono)."
+        if self.channels == 1:
+            return self
+        return AudioBuffer(self.mono()[np.newaxis, :], self.sr)
+
+    def at_rate(self, sr: int) -> "AudioBuffer":
+        """
+        This buffer resampled to *sr*. Each rate is computed once and then
+        shared by every caller holding this buffer.
+        """
+        if sr == self.sr:
+            return self
+        if sr not in self._rates:
+            self._rates[sr] = AudioBuffer(resample(self.samples, self.sr, sr), sr)
+        return self._rates[sr]
+
+    def blocks_at_rate(self, sr: int, block_frames: int = 1 << 20):
+        """
+        Yield the mono mix of this buffer at *sr* as successive 1-D blocks
+        of about *block_frames* frames. Unlike `at_rate` nothing is kept:
+        the buffer is mixed down and resampled block by block with a
+        streaming soxr resampler, so memory stays bounded by the block.
+        """
+        step = block_frames if sr == self.sr else max(1, block_frames * self.sr // sr)
+        stream = None
+        if sr != self.sr:
+            import soxr
+            stream = soxr.ResampleStream(self.sr, sr, 1, dtype="float32", quality="HQ")
+        for i in range(0, self.frames, step):
+            y = self.samples[:, i:i + step]
+            y = y[0] if self.channels == 1 else y.mean(axis=0)
+            if stream is None:
+                yield y
+            else:
+                yield stream.resample_chunk(np.ascontiguousarray(y, dtype=np.float32),
+                                            last=i + step >= self.frames)
+
+    def slice(self, start: float, end: float) -> "AudioBuffer":
+        "View of the samples between *start* and *end* seconds."
+        return AudioBuffer(
+            self.samples[:, int(start * self.sr):int(end * self.sr)], self.sr
+        )
+
+    def write(self, path: str | Path) -> Path:
+        "Write the buffer as a WAV file (debug output only)."
+        import soundfile as sf
+        sf.write(str(path), self.samples.T, self.sr)
+        return Path(path)
+
+
+def resample(y, orig_sr: int, target_sr: int) -> np.ndarray:
+    "Resample *y* (1-D or (channels, frames)) along its last axis with soxr."
+    if orig_sr == target_sr:
+        return y
+    import soxr
+    y = np.asarray(y, dtype=np.float32)
+    if y.ndim == 1:
+        return soxr.resample(y, orig_sr, target_sr, quality="HQ")
+    out = soxr.resample(np.ascontiguousarray(y.T), orig_sr, target_sr, quality="HQ")
+    return np.ascontiguousarray(out.T)
+
+
+def _ffmpeg_cmd(src: str | Path, sr: int, channels: int) -> list[str]:
+    if not shutil.which("ffmpeg"):
+        raise FileNotFoundError(
+            "ffmpeg not found. Please install ffmpeg and ensure it is in your PATH."
+        )
+    return ["ffmpeg", "-nostdin", "-v", "error", "-i", str(src), "-vn",
+            "-f", "f32le", "-acodec", "pcm_f32le",
+            "-ar", str(sr), "-ac", str(channels), "-"]
+
+
+def decode(src: str | Path, sr: int = 44_100, channels: int = 1) -> AudioBuffer:
+    "Decode *src* (audio or video) with ffmpeg straight into an AudioBuffer."
+    proc = subprocess.run(
+        _ffmpeg_cmd(src, sr, channels),
+        check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    y = np.frombuffer(proc.stdout, dtype=np.float32)
+    return AudioBuffer(y.reshape(-1, channels).T, sr)
+
+
+def decode_stream(src: str | Path, sr: int = 16_000, channels: int = 1,
+                  block_frames: int = 1 << 20):
+    """
+    Decode *src* like `decode`, but yield it as successive AudioBuffers of
+    *block_frames* frames (the last one shorter) read from ffmpeg's stdout,
+    so memory stays bounded however long the input is.
+    """
+    cmd = _ffmpeg_cmd(src, sr, channels)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    nbytes = block_frames * channels * 4
+    try:
+        while True:
+            data = proc.stdout.read(nbytes)
+            if data:
+                y = np.frombuffer(data, dtype=np.float32,
+                                  count=len(data) // (4 * channels) * channels)
+                yield AudioBuffer(y.reshape(-1, channels).T, sr)
+            if len(data) < nbytes:
+                break
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd,
+                                                stderr=proc.stderr.read())
+    finally:
+        if proc.poll() is None:   # consumer stopped early
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
@@ -0,0 +1,83 @@
+"Content-addressed on-disk cache for analysis results."
+from __future__ import annotations
+import hashlib, json, os, threading
+from pathlib import Path
+
+import numpy as np
+
+CACHE_VERSION = "1"  # bump when a cached representation changes
+
+
+class AnalysisCache:
+    """
+    Values live under ``root/<key[:2]>/<key>.<ext>``: a single array is
+    stored as ``.npy``, a dict of arrays as ``.npz`` and anything else as
+    ``.json``. Keys come from `key()`, so identical audio analysed with the
+    same models maps to the same entry whatever file or run it came from.
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    @staticmethod
+    def key(*parts) -> str:
+        "Hash arrays (by dtype, shape and bytes) and other values (by repr)."
+        h = hashlib.blake2b(CACHE_VERSION.encode(), digest_size=20)
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                part = np.ascontiguousarray(part)
+                h.update(f"{part.dtype}{part.shape}".encode())
+                h.update(memoryview(part).cast("B"))
+            else:
+                h.update(repr(part).encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str):
+        "Return the cached value for *key*, or None."
+        path = self._path(key)
+        for ext in (".npy", ".npz", ".json"):
+            p = path.with_suffix(ext)
+            if not p.exists():
+                continue
+            if ext == ".npy":
+                return np.load(p)
+            if ext == ".npz":
+                with np.load(p) as z:
+                    return {k: z[k] for k in z.files}
+            return json.loads(p.read_text())
+        return None
+
+    def put(self, key: str, value):
+        "Store *value* under *key* atomically and return it."
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(value, np.ndarray):
+            ext = ".npy"
+        elif isinstance(value, dict) and value and all(
+                isinstance(v, np.ndarray) for v in value.values()):
+            ext = ".npz"
+        else:
+            ext = ".json"
+        tmp = path.with_suffix(f".{os.getpid()}-{threading.get_ident()}.tmp{ext}")
+        if ext == ".npy":
+            np.save(tmp, value)
+        elif ext == ".npz":
+            np.savez(tmp, **value)
+        else:
+            tmp.write_text(json.dumps(value))
+        os.replace(tmp, path.with_suffix(ext))
+        return value
+
+
+def cached(cache: AnalysisCache | None, key: str, compute):
+    "Return cache[key], computing and storing it on a miss (no cache: just compute)."
+    if cache is None:
+        return compute()
+    value = cache.get(key)
+    if value is None:
+        value = cache.put(key, compute())
+    return value
@@ -4,26 +4,133 @@ os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'  # (Optional) Suppress some additional
 import warnings
 warnings.filterwarnings('ignore', category=UserWarning, module='keras')
 
-print("=== CLI MODULE LOADED (DEBUG) ===")
+import argparse, glob, logging, pathlib, os
+from . import log as logs
+from .pipeline import MUSIC_PROB_MODES, SEPARATE_MODES, analyse, shutdown_workers
 
-import argparse, pathlib, os
-from .pipeline import analyse
+log = logs.get_logger("cli")
 
 DEFAULT_OUT = pathlib.Path(__file__).resolve().parents[2] / "outputs"  # repo/outputs
+MEDIA_EXTS = {
+    ".wav", ".flac", ".mp3", ".m4a", ".aac", ".ogg", ".opus", ".aif", ".aiff",
+    ".mp4", ".mov", ".mkv", ".mxf", ".avi", ".webm",
+}
+
+def _stage_workers(text: str) -> tuple[str, int]:
+    name, _, n = text.partition("=")
+    if name not in ("separate", "detect", "mood") or not n.isdigit() or int(n) < 1:
+        raise argparse.ArgumentTypeError(f"expected STAGE=N, got {text!r}")
+    return name, int(n)
 
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(description="Auto-spotting CLI")
-    p.add_argument("src", help="Audio or video file (input)")
+    p.add_argument("src", nargs="*",
+                   help="Audio or video files, directories or glob patterns (input)")
+    p.add_argument("--manifest", type=pathlib.Path,
+                   help="Text file listing one input per line ('#' starts a comment)")
+    p.add_argument("--out", type=pathlib.Path, default=DEFAULT_OUT, help="Output folder")
     p.add_argument("--fps", type=int, default=25, help="Time-code FPS")
     p.add_argument("--thr", type=float, default=0.5, help="Mood prob threshold")
+    p.add_argument("--debug-audio", action="store_true",
+                   help="Also write decoded audio, segments and stems to the output folder")
+    p.add_argument("--demucs-segment", type=float, default=None,
+                   help="Demucs split length in seconds (model default if unset)")
+    p.add_argument("--demucs-overlap", type=float, default=0.25, help="Demucs split overlap")
+    p.add_argument("--demucs-shifts", type=int, default=1, help="Demucs random shifts")
+    p.add_argument("--pipelined", action="store_true",
+                   help="Run separation, detectors and mood on different regions concurrently")
+    p.add_argument("--stage-workers", type=_stage_workers, action="append", default=[],
+                   metavar="STAGE=N",
+                   help="Threads per stage, repeatable, e.g. detect=4 (separate, detect, mood)")
+    p.add_argument("--workers", type=int, default=1,
+                   help="Analyse regions in this many worker processes (each with its own models)")
+    p.add_argument("--cache-dir", type=pathlib.Path, default=None,
+                   help="Analysis cache folder (default: <out>/.cache)")
+    p.add_argument("--no-cache", action="store_true", help="Recompute everything, don't cache")
+    p.add_argument("--debug", action="append", default=None, metavar="COMPONENT",
+                   choices=(*logs.COMPONENTS, "all"),
+                   help="Enable debug logs for a component, repeatable "
+                        f"({', '.join(logs.COMPONENTS)} or all; default: ${logs.DEBUG_ENV})")
+    p.add_argument("--quiet", action="store_true", help="Only log warnings and errors")
+    p.add_argument("--separate", choices=SEPARATE_MODES, default="auto",
+                   help="Demucs separation: only for regions with speech over the music "
+                        "(auto), for every region, or never")
+    p.add_argument("--music-prob", choices=MUSIC_PROB_MODES, default="yamnet",
+                   help="MusicProb source: YAMNet frames of the mix (free), YAMNet on the "
+                        "separated stem, or the AST model on the stem (slowest)")
+    p.add_argument("--previous", type=pathlib.Path, default=None,
+                   help="Output folder of an earlier run on a previous version of the input; "
+                        "only new or changed material is re-analysed (batches: one subfolder "
+                        "per input, as written by that run)")
     return p
 
+def collect_inputs(srcs, manifest=None) -> list[pathlib.Path]:
+    "Expand files, directories (recursively) and globs into a de-duplicated input list."
+    entries = list(srcs)
+    if manifest is not None:
+        for line in pathlib.Path(manifest).read_text(encoding="utf-8").splitlines():
+            line = line.strip()
+            if line and not line.startswith("#"):
+                entries.append(line)
+    found = []
+    for entry in entries:
+        matches = glob.glob(entry, recursive=True) if glob.has_magic(entry) else [entry]
+        if not matches:
+            log.warning("No files match %s", entry)
+        for m in map(pathlib.Path, matches):
+            if m.is_dir():
+                found.extend(sorted(f for f in m.rglob("*")
+                                    if f.is_file() and f.suffix.lower() in MEDIA_EXTS))
+            else:
+                found.append(m)
+    return list(dict.fromkeys(found))
+
+def output_dirs(inputs, out: pathlib.Path) -> list[pathlib.Path]:
+    "One output folder per input, named after its stem (suffixed on collisions)."
+    dirs, seen = [], {}
+    for src in inputs:
+        n = seen.get(src.stem, 0)
+        seen[src.stem] = n + 1
+        dirs.append(out / (src.stem if n == 0 else f"{src.stem}_{n}"))
+    return dirs
+
 def main(argv=None):
-    print("CLI started")
-    args = build_parser().parse_args(argv)
-    analyse(pathlib.Path(args.src), DEFAULT_OUT, args.thr, args.fps)
-    print(f"Analysis complete. Output should be in: {DEFAULT_OUT}")
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logs.configure(logging.WARNING if args.quiet else logging.INFO, args.debug)
+    inputs = collect_inputs(args.src, args.manifest)
+    if not inputs:
+        parser.error("no input files given")
+    # A single input keeps writing straight into --out; batches get a folder
+    # per input. Models are loaded lazily once and stay warm across files.
+    outs = [args.out] if len(inputs) == 1 else output_dirs(inputs, args.out)
+    cache_dir = None if args.no_cache else (args.cache_dir or args.out / ".cache")
+    prevs = [None] * len(inputs) if args.previous is None else (
+        [args.previous] if len(inputs) == 1 else [args.previous / o.name for o in outs])
+    failed = []
+    try:
+        for n, (src, out, prev) in enumerate(zip(inputs, outs, prevs), 1):
+            log.info("[%d/%d] %s → %s", n, len(inputs), src, out)
+            try:
+                analyse(src, out, args.thr, args.fps,
+                        debug_audio=args.debug_audio, demucs_segment=args.demucs_segment,
+                        demucs_overlap=args.demucs_overlap, demucs_shifts=args.demucs_shifts,
+                        pipelined=args.pipelined, stage_workers=dict(args.stage_workers),
+                        workers=args.workers, cache_dir=cache_dir, previous=prev,
+                        music_prob=args.music_prob, separate_mode=args.separate)
+            except Exception as e:
+                log.error("Analysis failed for %s: %s", src, e)
+                log.debug("Traceback", exc_info=True)
+                failed.append(src)
+    finally:
+        shutdown_workers()   # --workers pool, shared by all inputs
+    log.info("Analysis complete. Output should be in: %s", args.out)
+    if failed:
+        log.error("%d of %d inputs failed: %s", len(failed), len(inputs),
+                  ", ".join(map(str, failed)))
+        return 1
+    return 0
 
 if __name__ == "__main__":
     import sys
-    main(sys.argv[1:])
+    sys.exit(main(sys.argv[1:]))
@@ -1,10 +1,18 @@
 # src/sibyllai_core/detectors/__init__.py
-from .ast import music_probability
-from .clap import tag_chunk
-from .m2e_wrapper import global_moods
+from .ast import music_probability, music_probability_curve
+from .clap import embed_chunks, tag_chunk, tag_chunks, tag_names, tag_scores
+from .m2e_wrapper import global_moods, global_moods_many
+from .segmentation import find_regions
 
 __all__ = [
     "music_probability",
+    "music_probability_curve",
+    "embed_chunks",
     "tag_chunk",
+    "tag_chunks",
+    "tag_names",
+    "tag_scores",
     "global_moods",
+    "global_moods_many",
+    "find_regions",
 ]
@@ -1,12 +1,15 @@
 "Audio-Spectrogram-Transformer music probability helper."
+import numpy as np
 import torch
-import librosa
 from transformers import (
     AutoProcessor,
     AutoModelForAudioClassification,
 )
 
+from ..audio import resample
+
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+AST_MODEL = "MIT/ast-finetuned-audioset-10-10-0.4593"
 
 # Lazy-loaded model and processor
 _proc = None
@@ -17,22 +20,63 @@ def _load_ast_model():
     global _proc, _model, _music_idx
     if _proc is None or _model is None or _music_idx is None:
         _proc = AutoProcessor.from_pretrained(
-            "MIT/ast-finetuned-audioset-10-10-0.4593"
+            AST_MODEL
         )
         _model = AutoModelForAudioClassification.from_pretrained(
-            "MIT/ast-finetuned-audioset-10-10-0.4593"
+            AST_MODEL
         ).to(DEVICE)
         _music_idx = _model.config.label2id["Music"]
 
 
-def music_probability(chunk, sr: int) -> float:
-    "Return probability [0-1] that *chunk* is music."
+def music_probability_curve(chunk, sr: int, window_s: float = 10.0,
+                            hop_s: float | None = None,
+                            batch_size: int = 8) -> tuple[float, np.ndarray]:
+    """
+    Tile *chunk* into *window_s* windows (AST sees ~10 s at a time) every
+    *hop_s* seconds and score them in batches. Returns the length-weighted
+    mean probability and the per-window curve.
+    """
+    _load_ast_model()
+    if sr != 16_000:
+        chunk = resample(chunk, sr, 16_000)
+        sr = 16_000
+
+    win = int(window_s * sr)
+    hop = int((hop_s or window_s) * sr)
+    starts = list(range(0, max(len(chunk) - win, 0) + 1, hop))
+    # cover the tail unless it is shorter than half a window
+    if starts[-1] + win < len(chunk) and len(chunk) - (starts[-1] + hop) >= win // 2:
+        starts.append(starts[-1] + hop)
+    windows = [chunk[s:s + win] for s in starts]
+
+    probs = []
+    with torch.inference_mode():
+        for i in range(0, len(windows), batch_size):
+            ins = _proc(windows[i:i + batch_size], sampling_rate=sr,
+                        return_tensors="pt", padding=True)
+            ins = {k: v.to(DEVICE) for k, v in ins.items()}
+            logits = _model(**ins).logits
+            probs.append(torch.sigmoid(logits[:, _music_idx]).cpu().numpy())
+    curve = np.concatenate(probs)
+    weights = np.array([len(w) for w in windows], dtype=np.float64)
+    return float(np.average(curve, weights=weights)), curve
+
+
+def music_probability(chunk, sr: int, windowed: bool = False) -> float:
+    """
+    Return probability [0-1] that *chunk* is music. By default the AST
+    processor truncates to the first ~10 s; *windowed* scores the whole
+    chunk via music_probability_curve().
+    """
+    if windowed:
+        return music_probability_curve(chunk, sr)[0]
     _load_ast_model()
     if sr != 16_000:
-        chunk = librosa.resample(y=chunk, orig_sr=sr, target_sr=16_000)
+        chunk = resample(chunk, sr, 16_000)
         sr = 16_000
 
-    ins   = _proc(chunk, sampling_rate=sr, return_tensors="pt", padding=True)
-    ins   = {k: v.to(DEVICE) for k, v in ins.items()}
-    logits = _model(**ins).logits
+    with torch.inference_mode():
+        ins   = _proc(chunk, sampling_rate=sr, return_tensors="pt", padding=True)
+        ins   = {k: v.to(DEVICE) for k, v in ins.items()}
+        logits = _model(**ins).logits
     return torch.sigmoid(logits)[0, _music_idx].item()
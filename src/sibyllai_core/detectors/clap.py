@@ -1,25 +1,142 @@
 "LAION-CLAP tag similarity helper."
+import hashlib, os
+from pathlib import Path
 import numpy as np
-import librosa
+import torch
+
+from ..audio import resample
+
+# Tag vocabulary file, CLAP checkpoint (None = laion_clap default) and the
+# directory where text embeddings are cached between runs.
+TAGS_PATH = Path(os.environ.get("SIBYLLAI_CLAP_TAGS", Path(__file__).with_name("clap_tags.txt")))
+CLAP_CKPT = os.environ.get("SIBYLLAI_CLAP_CKPT")
+CACHE_DIR = Path(os.environ.get("SIBYLLAI_CACHE_DIR", Path.home() / ".cache" / "sibyllai"))
 
 _clap = None
-_TAGS = ["rock", "classical", "contains speech", "lo-fi", "orchestral"]
+_TAGS = None
+_temb = None    # (n_tags, dim) L2-normalised text embeddings of _TAGS
 
-def tag_chunk(chunk, sr: int) -> dict[str, float]:
-    """
-    Return {tag: similarity} for a small fixed tag list.
-    """
+def load_tags(path) -> list[str]:
+    "Read one tag per line from *path*, skipping blanks and '#' comments."
+    lines = Path(path).read_text(encoding="utf-8").splitlines()
+    return [l.strip() for l in lines if l.strip() and not l.lstrip().startswith("#")]
+
+
+def set_tags(tags) -> None:
+    "Replace the tag vocabulary; its embeddings are loaded or computed on next use."
+    global _TAGS, _temb
+    _TAGS = list(dict.fromkeys(tags))
+    _temb = None
+
+
+def _load_clap_model():
     global _clap
     if _clap is None:
         import laion_clap
         _clap = laion_clap.CLAP_Module(enable_fusion=False)
-        _clap.load_ckpt()
+        _clap.load_ckpt(CLAP_CKPT)
+
+
+def tags_signature() -> str:
+    "Short hash of the CLAP checkpoint and tag vocabulary, e.g. to key cached results."
+    global _TAGS
+    if _TAGS is None:
+        _TAGS = load_tags(TAGS_PATH)
+    return hashlib.sha1(
+        "\n".join([CLAP_CKPT or "default", *_TAGS]).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+def _text_embeddings(batch_size: int = 128):
+    "Return (tags, normalised text embeddings), cached in memory and on disk."
+    global _temb
+    if _temb is None:
+        key = tags_signature()
+        cache_path = CACHE_DIR / f"clap_text_{key}.npy"
+        if cache_path.exists():
+            _temb = np.load(cache_path)
+        else:
+            _load_clap_model()
+            with torch.inference_mode():
+                temb = np.concatenate([
+                    _clap.get_text_embedding(_TAGS[i:i + batch_size])
+                    for i in range(0, len(_TAGS), batch_size)
+                ]).astype(np.float32)
+            temb /= np.linalg.norm(temb, axis=1, keepdims=True)
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(f".{os.getpid()}.npy")
+            np.save(tmp_path, temb)
+            os.replace(tmp_path, cache_path)
+            _temb = temb
+    return _TAGS, _temb
+
+
+def tag_names() -> list[str]:
+    "Current tag vocabulary, in the column order used by tag_chunks()."
+    return _text_embeddings()[0]
+
+
+def _windows(y, win: int):
+    "Split *y* into *win*-sample windows; a short tail is kept if it is the only one or >= win/2."
+    if len(y) <= win:
+        return [y]
+    out = [y[i:i + win] for i in range(0, len(y), win)]
+    if len(out[-1]) < win // 2:
+        out.pop()
+    return out
 
-    if sr != 48_000:
-        chunk = librosa.resample(y=chunk, orig_sr=sr, target_sr=48_000)
-        sr = 48_000
 
-    emb  = _clap.get_audio_embedding_from_data(chunk.reshape(1, -1))[0]
-    temb = _clap.get_text_embedding(_TAGS)
-    sims = (emb @ temb.T) / (np.linalg.norm(emb) * np.linalg.norm(temb, axis=1))
-    return dict(zip(_TAGS, sims))
+def embed_chunks(chunks, sr: int, window_s: float = 10.0, batch_size: int = 16) -> np.ndarray:
+    """
+    Return (n_chunks, dim) L2-normalised CLAP audio embeddings.
+
+    Each chunk is resampled to 48 kHz once and tiled into *window_s*
+    windows (CLAP's 10 s input); all windows go through the audio encoder
+    in batches of *batch_size* and are averaged per chunk.
+    """
+    _load_clap_model()
+    if not len(chunks):
+        return np.zeros((0, 512), dtype=np.float32)
+
+    win = int(window_s * 48_000)
+    windows, owner = [], []
+    for n, chunk in enumerate(chunks):
+        if sr != 48_000:
+            chunk = resample(chunk, sr, 48_000)
+        for w in _windows(np.asarray(chunk, dtype=np.float32), win):
+            windows.append(w)
+            owner.append(n)
+
+    # laion_clap leaves autograd on; without this every batch keeps its activations
+    with torch.inference_mode():
+        emb = np.concatenate([
+            _clap.get_audio_embedding_from_data(windows[i:i + batch_size])
+            for i in range(0, len(windows), batch_size)
+        ])
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+
+    # mean of normalised window embeddings per chunk, renormalised
+    pooled = np.zeros((len(chunks), emb.shape[1]), dtype=np.float32)
+    np.add.at(pooled, np.asarray(owner, dtype=np.int64), emb)
+    pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+    return pooled
+
+
+def tag_scores(emb: np.ndarray) -> np.ndarray:
+    "Cosine similarity of embed_chunks() output against the tag vocabulary."
+    return emb @ _text_embeddings()[1].T
+
+
+def tag_chunks(chunks, sr: int, window_s: float = 10.0, batch_size: int = 16) -> np.ndarray:
+    """
+    Return a (n_chunks, n_tags) cosine-similarity matrix for *chunks*,
+    columns in tag_names() order. See embed_chunks() for the batching.
+    """
+    return tag_scores(embed_chunks(chunks, sr, window_s, batch_size))
+
+
+def tag_chunk(chunk, sr: int) -> dict[str, float]:
+    """
+    Return {tag: cosine similarity} over the tag vocabulary.
+    """
+    return dict(zip(tag_names(), tag_chunks([chunk], sr)[0]))
@@ -1,11 +1,54 @@
 "Thin wrapper around third-party Music2Emo package."
-from ..thirdparty.music2emo.music2emo import Music2emo
+from ..thirdparty.music2emo.music2emo import Music2emo, chord_rate, cqt_backend, resample_rate
+
+# Identifies the checkpoints behind cached MERT / BTC features
+# (chords are cached per frame; key and encoding are derived from them;
+# inputs are resampled with soxr by the pipeline)
+M2E_MODEL = ("music2emo:J_all.ckpt+MERT-v1-95M[5,6]:unpadded+btc_model_large_voca.pt:frames"
+             f"+cqt-{cqt_backend}+soxr")
+
+# Input rate of each feature, for callers handing in views already resampled
+M2E_RATES = {"mert": resample_rate, "chords": chord_rate}
 
 _m2e = None
 
-def global_moods(wav_path: str, threshold: float = 0.5):
-    "Return {'valence':…, 'arousal':…, 'predicted_moods':[…]} dict."
+def _load_m2e_model(mert: bool = True):
+    "Shared Music2emo instance; *mert* also loads MERT, which only the head doesn't need."
     global _m2e
     if _m2e is None:
         _m2e = Music2emo()
-    return _m2e.predict(wav_path, threshold=threshold)
+    if mert:
+        _m2e.load_mert()
+    return _m2e
+
+def global_moods(audio, threshold: float = 0.5, sr: int | None = None,
+                 features: dict | None = None):
+    """
+    Return {'valence':…, 'arousal':…, 'predicted_moods':[…]} dict.
+    *audio* is a wav path or a mono array sampled at *sr*; *features* is
+    passed through to `Music2emo.predict` to reuse / collect MERT and BTC
+    intermediates.
+    """
+    return _load_m2e_model().predict(audio, threshold=threshold, sr=sr, features=features)
+
+def global_moods_many(audios, sr, threshold: float = 0.5,
+                      features: list | None = None) -> list:
+    """
+    `global_moods` for many in-memory cues at once: *sr* is one rate or a
+    list, *features* one dict per cue. MERT runs over all of them in shared
+    batches (see `Music2emo.predict_many`).
+    """
+    return _load_m2e_model().predict_many(audios, sr, threshold=threshold, features=features)
+
+def m2e_features(audio, sr: int | None, features: dict | None = None) -> dict:
+    """
+    Compute the MERT / BTC intermediates of one in-memory cue into
+    *features* (keeping any already there) without running the mood head.
+    *audio* is a mono array at *sr*, or {rate: mono array} with the
+    `M2E_RATES` views already resampled (*sr* is then unused).
+    """
+    return _load_m2e_model().features_many([audio], sr, None if features is None else [features])[0]
+
+def moods_from_features(features: list, threshold: float = 0.5) -> list:
+    "Mood dicts for many cues' features, with the head run once as a batch."
+    return _load_m2e_model(mert=False).predict_features(features, threshold=threshold)
@@ -0,0 +1,62 @@
+"Vectorised region extraction from per-frame detector probabilities."
+from __future__ import annotations
+
+import numpy as np
+
+
+def median_smooth(probs: np.ndarray, width: int) -> np.ndarray:
+    "Running median over *width* frames (made odd), edges padded by repetition."
+    width |= 1
+    if width <= 1 or len(probs) == 0:
+        return probs
+    padded = np.pad(probs, width // 2, mode="edge")
+    return np.median(np.lib.stride_tricks.sliding_window_view(padded, width), axis=1)
+
+
+def hysteresis(probs: np.ndarray, on: float, off: float | None = None) -> np.ndarray:
+    """
+    Boolean activity per frame: a region opens where ``probs > on`` and
+    stays open while ``probs > off`` (*off* defaults to *on*, i.e. a single
+    threshold).
+    """
+    high = probs > on
+    if off is None or off >= on:
+        return high
+    low = probs > off
+    idx = np.arange(len(probs))
+    # for each frame: where its run of `low` frames began, and the last
+    # `high` frame so far; active once the run has reached `high`
+    run_start = np.maximum.accumulate(np.where(low & ~np.r_[False, low[:-1]], idx, -1))
+    last_high = np.maximum.accumulate(np.where(high, idx, -1))
+    return low & (last_high >= run_start)
+
+
+def runs(active: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    "(starts, ends) frame indices of the True runs of *active*, ends exclusive."
+    d = np.diff(active.astype(np.int8), prepend=0, append=0)
+    return np.flatnonzero(d == 1), np.flatnonzero(d == -1)
+
+
+def find_regions(probs, hop_s: float, on: float = 0.5, off: float | None = None,
+                 median_s: float = 0.0, min_duration: float = 0.0,
+                 min_gap: float = 0.0) -> list[tuple[float, float]]:
+    """
+    Return (start_time, end_time) regions where *probs* (one value per
+    *hop_s* frame) is active.
+
+    Frames are median-smoothed over *median_s*, thresholded with hysteresis
+    (*on* to open, *off* to close), regions separated by less than *min_gap*
+    seconds are merged and those still shorter than *min_duration* dropped.
+    With the defaults for off/median_s/min_duration this matches a single
+    ``probs > on`` threshold followed by gap merging.
+    """
+    probs = np.asarray(probs, dtype=np.float32)
+    probs = median_smooth(probs, int(round(median_s / hop_s)))
+    starts, ends = runs(hysteresis(probs, on, off))
+    if len(starts) > 1 and min_gap > 0:
+        keep = (starts[1:] - ends[:-1]) * hop_s >= min_gap
+        starts, ends = starts[np.r_[True, keep]], ends[np.r_[keep, True]]
+    if min_duration > 0:
+        long_enough = (ends - starts) * hop_s >= min_duration
+        starts, ends = starts[long_enough], ends[long_enough]
+    return [(s * hop_s, e * hop_s) for s, e in zip(starts.tolist(), ends.tolist())]
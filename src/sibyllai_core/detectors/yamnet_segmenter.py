@@ -1,80 +1,231 @@
+import json
 import os
-import subprocess
+from pathlib import Path
+
 import numpy as np
 import tensorflow as tf
 import tensorflow_hub as hub
-import soundfile as sf
-
-def extract_audio(input_path, output_path):
-    input_path = str(input_path)
-    output_path = str(output_path)
-    if input_path.lower().endswith('.wav'):
-        return input_path
-    cmd = [
-        "ffmpeg", "-y", "-i", input_path,
-        "-ac", "1", "-ar", "16000", "-vn", output_path
-    ]
-    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    return output_path
-
-def segment_music_regions(audio_path, music_thresh=0.2, min_gap=1.0):
+
+from ..audio import AudioBuffer, decode_stream
+from ..log import get_logger
+from .segmentation import find_regions
+
+# TF-Hub handle or local SavedModel directory; point it at an unpacked
+# yamnet/1 directory to run offline without the hub download/resolve step.
+YAMNET_HANDLE = os.environ.get("SIBYLLAI_YAMNET_MODEL", "https://tfhub.dev/google/yamnet/1")
+log = get_logger("yamnet")
+
+CLASS_MAP_PATH = os.path.join(os.path.dirname(__file__), "yamnet_class_map.csv")
+# classes kept from the score matrix for spotting timelines
+TIMELINE_CLASSES = ("Music", "Speech", "Singing", "Applause", "Silence", "Sound effect")
+
+
+class YAMNetSegmenter:
     """
-    Returns a list of (start_time, end_time) tuples for detected music regions in the audio file.
+    YAMNet model with its class index resolved once. Build it through
+    `_load_yamnet_model()` so the process shares a single instance. The
+    TF graph itself is only loaded when scores are first computed.
+
+    Scores are computed block by block: YAMNet's patch k covers samples
+    [k*patch_hop, k*patch_hop + patch_len) of its 16 kHz input (a 0.96 s
+    log-mel patch of 25 ms windows, hopped by 0.48 s), so feeding it blocks
+    of (N-1)*patch_hop + patch_len samples that advance by N*patch_hop gives
+    exactly the patches of a single whole-file call.
     """
-    temp_wav = "temp_extracted.wav"
-    wav_path = extract_audio(audio_path, temp_wav)
-    yamnet_model = hub.load("https://tfhub.dev/google/yamnet/1")
-    # Load class map from the same directory as this file
-    import pandas as pd
-    class_map_url = "https://raw.githubusercontent.com/tensorflow/models/master/research/audioset/yamnet/yamnet_class_map.csv"
-    class_map_path = os.path.join(os.path.dirname(__file__), "yamnet_class_map.csv")
-    if not os.path.exists(class_map_path):
-        import urllib.request
-        urllib.request.urlretrieve(class_map_url, class_map_path)
-    class_names = pd.read_csv(class_map_path)["display_name"].tolist()
-    music_idx = class_names.index("Music")
-    # Load audio
-    waveform, sr = sf.read(wav_path)
-    if len(waveform.shape) > 1:
-        waveform = np.mean(waveform, axis=1)
-    if sr != 16000:
-        import librosa
-        waveform = librosa.resample(waveform, orig_sr=sr, target_sr=16000)
-    waveform = waveform.astype(np.float32)
-    # Run YAMNet
-    scores, _, _ = yamnet_model(waveform)
-    music_probs = scores[:, music_idx].numpy()
+    sr = 16000
     frame_hop_s = 0.48
-    frame_times = np.arange(len(music_probs)) * frame_hop_s
-    # Segment logic
-    def get_segments(probs, threshold, frame_times):
-        above = probs > threshold
-        segments = []
-        start = None
-        for i, flag in enumerate(above):
-            if flag and start is None:
-                start = frame_times[i]
-            elif not flag and start is not None:
-                end = frame_times[i]
-                segments.append((start, end))
-                start = None
-        if start is not None:
-            segments.append((start, frame_times[-1] + frame_hop_s))
-        return segments
-    def merge_close_segments(segments, min_gap=1.0):
-        if not segments:
-            return []
-        merged = [segments[0]]
-        for start, end in segments[1:]:
-            prev_start, prev_end = merged[-1]
-            if start - prev_end < min_gap:
-                merged[-1] = (prev_start, end)
+    patch_hop = 7680     # 0.48 s
+    patch_len = 15600    # 0.96 s of 10 ms STFT hops plus one 25 ms window
+
+    def __init__(self, model_handle=YAMNET_HANDLE):
+        self.model_handle = str(model_handle)
+        self._model = None
+        self.class_names = self._load_class_names()
+        self.music_idx = self.class_names.index("Music")
+
+    @property
+    def model(self):
+        if self._model is None:
+            if os.path.isdir(self.model_handle):
+                self._model = tf.saved_model.load(self.model_handle)
             else:
-                merged.append((start, end))
-        return merged
-    music_segments = get_segments(music_probs, music_thresh, frame_times)
-    music_segments = merge_close_segments(music_segments, min_gap=min_gap)
-    # Clean up temp file if created
-    if wav_path == temp_wav and os.path.exists(temp_wav):
-        os.remove(temp_wav)
-    return music_segments 
\ No newline at end of file
+                self._model = hub.load(self.model_handle)
+        return self._model
+
+    def _load_class_names(self):
+        import pandas as pd
+        # Prefer the CSV shipped next to this file, then the copy bundled
+        # as an asset of the SavedModel, so no network access is needed.
+        if os.path.exists(CLASS_MAP_PATH):
+            class_map_path = CLASS_MAP_PATH
+        else:
+            class_map_path = self.model.class_map_path().numpy().decode()
+        return pd.read_csv(class_map_path)["display_name"].tolist()
+
+    def _blocks(self, chunks, patches):
+        "Regroup 1-D 16 kHz *chunks* into model inputs of *patches* patches each."
+        size = (patches - 1) * self.patch_hop + self.patch_len
+        buf, emitted = np.zeros(0, dtype=np.float32), 0
+        for chunk in chunks:
+            buf = np.concatenate([buf, chunk])
+            while len(buf) >= size:
+                yield buf[:size]
+                buf = buf[patches * self.patch_hop:]
+                emitted += patches
+        # the model pads the tail; only run it if a whole-file call would
+        # have had another patch there (or there was no patch at all)
+        if len(buf) > self.patch_len - self.patch_hop or not emitted:
+            yield buf
+
+    def iter_scores(self, audio, block_patches=256):
+        """
+        Yield the YAMNet score matrix of *audio* in consecutive (patches, 521)
+        blocks of *block_patches* (~2 min). *audio* is an AudioBuffer, mixed
+        down and resampled to 16 kHz block by block, or a path that is
+        streamed from ffmpeg at 16 kHz and never fully decoded.
+        """
+        size = (block_patches - 1) * self.patch_hop + self.patch_len
+        if isinstance(audio, AudioBuffer):
+            chunks = audio.blocks_at_rate(self.sr, size)
+        else:
+            chunks = (b.samples[0] for b in decode_stream(audio, sr=self.sr, block_frames=size))
+        for block in self._blocks(chunks, block_patches):
+            scores, _, _ = self.model(block.astype(np.float32, copy=False))
+            log.debug("scored %d samples → %d frames", len(block), scores.shape[0])
+            yield scores.numpy()
+
+    def scores(self, audio):
+        "Return the (frames, 521) YAMNet score matrix for *audio*."
+        return np.concatenate(list(self.iter_scores(audio)))
+
+    def _frames(self, scores, start=0.0, end=None):
+        hop = self.frame_hop_s
+        a = min(int(round(start / hop)), len(scores) - 1)
+        b = len(scores) if end is None else max(a + 1, int(round(end / hop)))
+        return scores[a:b]
+
+    def music_probability(self, scores, start=0.0, end=None):
+        "Mean 'Music' score of the frames between *start* and *end* seconds."
+        return float(self._frames(scores, start, end)[:, self.music_idx].mean())
+
+    def class_fraction(self, scores, name, thresh=0.2, start=0.0, end=None):
+        "Fraction of the frames between *start* and *end* where *name* scores above *thresh*."
+        frames = self._frames(scores, start, end)[:, self.class_names.index(name)]
+        return float((frames > thresh).mean())
+
+    def timelines(self, scores, classes=TIMELINE_CLASSES):
+        "(frames, len(classes)) float16 columns of the score matrix for *classes*."
+        idx = [self.class_names.index(c) for c in classes]
+        return scores[:, idx].astype(np.float16)
+
+    def class_regions(self, scores, classes=TIMELINE_CLASSES, thresh=0.2, min_gap=1.0,
+                      **params):
+        "{class: [(start_time, end_time), ...]} regions for each of *classes*."
+        return {
+            c: find_regions(scores[:, self.class_names.index(c)], self.frame_hop_s,
+                            on=thresh, min_gap=min_gap, **params)
+            for c in classes
+        }
+
+    def stream(self, audio, music_thresh=0.2, min_gap=1.0, block_patches=256, **params):
+        """
+        Like `analyse`, but yield each (start_time, end_time) music region
+        as soon as it is final, scoring *audio* block by block (see
+        `iter_scores`). Only the music column is kept, so memory is bounded
+        by the block size.
+        """
+        hop = self.frame_hop_s
+        # a region is final once no later frame can extend or merge it
+        margin = min_gap + params.get("median_s", 0.0) / 2 + hop
+        probs, done = np.zeros(0, dtype=np.float32), 0
+        for block in self.iter_scores(audio, block_patches):
+            probs = np.concatenate([probs, block[:, self.music_idx]])
+            regions = find_regions(probs, hop, on=music_thresh, min_gap=min_gap, **params)
+            final = [r for r in regions[done:] if r[1] + margin <= len(probs) * hop]
+            yield from final
+            done += len(final)
+        yield from find_regions(probs, hop, on=music_thresh, min_gap=min_gap, **params)[done:]
+
+    def analyse(self, audio, music_thresh=0.2, min_gap=1.0, scores=None, **params):
+        """
+        Return (start_time, end_time) tuples for detected music regions.
+        Pass precomputed *scores* (e.g. from the analysis cache) to skip YAMNet.
+        Extra *params* (off, median_s, min_duration) go to
+        `segmentation.find_regions`.
+        """
+        if scores is None:
+            scores = self.scores(audio)
+        return find_regions(scores[:, self.music_idx], self.frame_hop_s,
+                            on=music_thresh, min_gap=min_gap, **params)
+
+
+# Lazy-loaded segmenter
+_segmenter = None
+
+def _load_yamnet_model(model_handle=None):
+    global _segmenter
+    model_handle = str(model_handle or YAMNET_HANDLE)
+    if _segmenter is None or _segmenter.model_handle != model_handle:
+        _segmenter = YAMNetSegmenter(model_handle)
+    return _segmenter
+
+
+def export_timelines(scores, out_dir, classes=TIMELINE_CLASSES, thresh=0.2, min_gap=1.0,
+                     model_handle=None, parquet=False, **params):
+    """
+    Write the per-frame scores of *classes* from an existing YAMNet pass as
+    ``yamnet_timelines.npy`` (float16, frames × classes, one frame per
+    0.48 s) and their regions as ``yamnet_regions.json``. With *parquet*
+    the timelines also go to ``yamnet_timelines.parquet`` (needs pyarrow or
+    fastparquet). Returns the paths written.
+    """
+    yamnet = _load_yamnet_model(model_handle)
+    out_dir = Path(out_dir)
+    timelines = yamnet.timelines(scores, classes)
+    paths = [out_dir / "yamnet_timelines.npy", out_dir / "yamnet_regions.json"]
+    np.save(paths[0], timelines)
+    regions = yamnet.class_regions(scores, classes, thresh=thresh, min_gap=min_gap, **params)
+    paths[1].write_text(json.dumps({
+        "hop_s": yamnet.frame_hop_s,
+        "classes": list(classes),
+        "regions": {c: [[round(s, 3), round(e, 3)] for s, e in r] for c, r in regions.items()},
+    }, indent=2))
+    if parquet:
+        import pandas as pd
+        df = pd.DataFrame(timelines, columns=list(classes))
+        df.insert(0, "time", np.arange(len(df)) * yamnet.frame_hop_s)
+        paths.append(out_dir / "yamnet_timelines.parquet")
+        df.to_parquet(paths[-1], index=False)
+    return paths
+
+
+def stream_music_regions(src, music_thresh=0.2, min_gap=1.0, model_handle=None,
+                         block_patches=256, **params):
+    """
+    Yield (start_time, end_time) music regions of *src* (a path streamed
+    from ffmpeg, or an AudioBuffer) incrementally, with memory bounded
+    regardless of input length. Same regions as `segment_music_regions`.
+    """
+    yield from _load_yamnet_model(model_handle).stream(
+        src, music_thresh=music_thresh, min_gap=min_gap, block_patches=block_patches, **params
+    )
+
+
+def segment_music_regions(audio, music_thresh=0.2, min_gap=1.0, model_handle=None,
+                          scores=None, return_scores=False, **params):
+    """
+    Returns a list of (start_time, end_time) tuples for detected music regions.
+    *audio* is an AudioBuffer already decoded by the pipeline, or a path that
+    is streamed from ffmpeg at 16 kHz. The YAMNet model is loaded on first use
+    and reused by later calls. Extra *params* (off, median_s, min_duration)
+    tune `segmentation.find_regions`. With *return_scores* the (frames, 521)
+    score matrix is returned too, as ``(regions, scores)``, e.g. for
+    `YAMNetSegmenter.music_probability`.
+    """
+    yamnet = _load_yamnet_model(model_handle)
+    if scores is None:
+        scores = yamnet.scores(audio)
+    regions = yamnet.analyse(
+        audio, music_thresh=music_thresh, min_gap=min_gap, scores=scores, **params
+    )
+    return (regions, scores) if return_scores else regions
@@ -0,0 +1,157 @@
+"Incremental re-analysis: audio fingerprints and alignment against a previous run."
+from __future__ import annotations
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .audio import AudioBuffer
+
+RUN_RECORD = "run.json"
+FINGERPRINT_FILE = "fingerprint.npy"
+
+# Haitsma–Kalker style sub-fingerprints: 32 bits per 11.6 ms hop from the
+# energy differences of 33 log-spaced bands (300–2000 Hz) over 0.37 s frames.
+FP_SR = 5512
+FP_FRAME = 2048
+FP_HOP = 64
+FP_HOP_S = FP_HOP / FP_SR
+_BAND_EDGES = np.geomspace(300.0, 2000.0, 34)
+
+
+def fingerprint(audio: AudioBuffer, block: int = 4096) -> np.ndarray:
+    "Return one uint32 sub-fingerprint per FP_HOP_S of *audio*."
+    y = audio.at_rate(FP_SR).mono().astype(np.float32, copy=False)
+    if len(y) < FP_FRAME + FP_HOP:
+        return np.zeros(0, dtype=np.uint32)
+    frames = np.lib.stride_tricks.sliding_window_view(y, FP_FRAME)[::FP_HOP]
+    bins = np.searchsorted(np.fft.rfftfreq(FP_FRAME, 1 / FP_SR), _BAND_EDGES)
+    window = np.hanning(FP_FRAME).astype(np.float32)
+    energy = np.empty((len(frames), 33), dtype=np.float32)
+    for i in range(0, len(frames), block):   # bounded memory on long inputs
+        spec = np.abs(np.fft.rfft(frames[i:i + block] * window, axis=1)) ** 2
+        energy[i:i + block] = np.add.reduceat(spec, bins[:-1], axis=1)
+    diff = energy[:, :-1] - energy[:, 1:]
+    bits = (diff[1:] - diff[:-1]) > 0                        # (frames-1, 32)
+    return np.packbits(bits, axis=1, bitorder="little").view("<u4")[:, 0].copy()
+
+
+class FingerprintIndex:
+    "Sorted view of a fingerprint for locating spans of another one in it."
+
+    def __init__(self, fp: np.ndarray, max_hits: int = 32):
+        self.fp = fp
+        self.order = np.argsort(fp, kind="stable")
+        self.sorted = fp[self.order]
+        self.max_hits = max_hits   # ignore values this common (silence, hum)
+
+    def align(self, other: np.ndarray, a: int, b: int,
+              max_ber: float = 0.35, min_frames: int = 43) -> int | None:
+        """
+        Return the frame offset at which ``other[a:b]`` occurs in the
+        indexed fingerprint, or None if it doesn't: the bit error rate at
+        the best-voted offset must stay under *max_ber* in every stretch of
+        *min_frames*, so a span with an edit in it is not matched.
+        """
+        b = min(b, len(other))
+        blk = other[a:b]
+        if len(blk) < min_frames:
+            return None
+        lo = np.searchsorted(self.sorted, blk, side="left")
+        hi = np.searchsorted(self.sorted, blk, side="right")
+        cnt = hi - lo
+        keep = (cnt > 0) & (cnt <= self.max_hits)
+        if not keep.any():
+            return None
+        cnt_k = cnt[keep]
+        j = np.repeat(np.nonzero(keep)[0], cnt_k)
+        first = np.repeat(lo[keep], cnt_k)
+        within = np.arange(len(j)) - np.repeat(np.cumsum(cnt_k) - cnt_k, cnt_k)
+        offsets = self.order[first + within] - (a + j)
+        vals, votes = np.unique(offsets, return_counts=True)
+        off = int(vals[np.argmax(votes)])
+        a, b = max(a, -off), min(b, len(self.fp) - off)   # stay inside both
+        if b - a < min_frames:
+            return None
+        blk = other[a:b]
+        xor = np.bitwise_xor(blk, self.fp[a + off:b + off])
+        errors = np.unpackbits(xor.view(np.uint8)).reshape(len(blk), 32).sum(1)
+        n = len(blk) // min_frames * min_frames
+        ber = errors[:n].reshape(-1, min_frames).mean(1) / 32
+        if n < len(blk):
+            ber = np.append(ber, errors[-min_frames:].mean() / 32)
+        return off if ber.max() <= max_ber else None
+
+
+def save_run(out_dir: Path, fp: np.ndarray, record: dict) -> None:
+    "Write the fingerprint and run record that a later --previous run reads."
+    np.save(Path(out_dir) / FINGERPRINT_FILE, fp)
+    (Path(out_dir) / RUN_RECORD).write_text(json.dumps(record, indent=2))
+
+
+def load_run(run_dir: str | Path) -> tuple[np.ndarray, dict]:
+    run_dir = Path(run_dir)
+    if not (run_dir / RUN_RECORD).exists() or not (run_dir / FINGERPRINT_FILE).exists():
+        raise FileNotFoundError(
+            f"{run_dir} has no {RUN_RECORD}/{FINGERPRINT_FILE}; was it written by analyse()?"
+        )
+    return np.load(run_dir / FINGERPRINT_FILE), json.loads((run_dir / RUN_RECORD).read_text())
+
+
+def plan_reuse(prev_fp: np.ndarray, prev: dict, new_fp: np.ndarray, duration: float,
+               settings: dict | None = None, block_s: float = 10.0,
+               min_changed_s: float = 0.5):
+    """
+    Align a previous run against the new audio.
+
+    Each previous music region that is found intact (one offset, low bit
+    error rate) is carried over with shifted timecodes; previous non-music
+    stretches are matched in *block_s* blocks. Returns ``(reused, changed)``:
+    the shifted previous regions (with their result rows, if any) and the
+    (start, end) spans of new audio nothing could be matched to.
+
+    Result rows are only carried when the previous run recorded the same
+    *settings* (models, thresholds, modes; see `analyse`); otherwise its
+    regions come back without rows, to be analysed again.
+    """
+    index = FingerprintIndex(new_fp)
+    covered = np.zeros(len(new_fp), dtype=bool)
+    to_frame = lambda t: int(round(t / FP_HOP_S))
+    rows = ({(r["start"], r["end"]): r for r in prev["rows"]}
+            if prev.get("settings") == settings else {})
+
+    reused = []
+    for start, end in prev["music_regions"]:
+        a, b = to_frame(start), min(to_frame(end), len(prev_fp))
+        off = index.align(prev_fp, a, b)
+        if off is None:
+            continue
+        covered[max(a + off, 0):b + off] = True
+        shift = off * FP_HOP_S
+        row = rows.get((start, end))
+        if row is not None:
+            row = {**row, "start": start + shift, "end": end + shift}
+        reused.append(((start + shift, end + shift), row))
+
+    # previous stretches without music, in blocks
+    edges = [0] + [to_frame(t) for se in prev["music_regions"] for t in se] + [len(prev_fp)]
+    step = to_frame(block_s)
+    for a0, b0 in zip(edges[::2], edges[1::2]):
+        for a in range(a0, b0, step):
+            b = min(a + step, b0)
+            off = index.align(prev_fp, a, b)
+            if off is not None:
+                covered[max(a + off, 0):b + off] = True
+
+    # runs of uncovered frames → changed spans in seconds
+    flips = np.diff(np.concatenate([[1], covered.view(np.int8), [1]]))
+    changed = [
+        (float(s * FP_HOP_S), float(min(e * FP_HOP_S, duration)))
+        for s, e in zip(np.nonzero(flips == -1)[0], np.nonzero(flips == 1)[0])
+        if (e - s) * FP_HOP_S >= min_changed_s
+    ]
+    # audio past the end of the fingerprint (last partial frame)
+    tail = len(new_fp) * FP_HOP_S
+    if duration - tail >= min_changed_s:
+        changed.append((tail, duration))
+    return sorted(reused, key=lambda sr: sr[0]), changed
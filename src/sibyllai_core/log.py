@@ -0,0 +1,37 @@
+"Logging: one stdlib logger per component under 'sibyllai', diagnostics off by default."
+from __future__ import annotations
+import logging, os
+
+ROOT = "sibyllai"
+# components with their own logger, enabled one by one with --debug / SIBYLLAI_DEBUG
+COMPONENTS = ("cli", "pipeline", "yamnet", "music2emo")
+DEBUG_ENV = "SIBYLLAI_DEBUG"
+
+
+def get_logger(component: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT}.{component}")
+
+
+def configure(level: int = logging.INFO, debug=None) -> None:
+    """
+    Send 'sibyllai' logs at *level* and above to stderr, and DEBUG records
+    of the components in *debug* ("all" for every one). *debug* defaults to
+    the comma-separated $SIBYLLAI_DEBUG; it is written back there so worker
+    processes calling configure() follow the same settings.
+    """
+    if debug is None:
+        debug = os.environ.get(DEBUG_ENV, "").split(",")
+    debug = [d.strip() for d in debug if d.strip()]
+    os.environ[DEBUG_ENV] = ",".join(debug)
+
+    root = logging.getLogger(ROOT)
+    if not any(getattr(h, "_sibyllai", False) for h in root.handlers):
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("[%(levelname)s] %(name)s: %(message)s"))
+        handler._sibyllai = True
+        root.addHandler(handler)
+    root.setLevel(level)
+    for name in COMPONENTS:
+        get_logger(name).setLevel(logging.NOTSET)
+    for name in debug:
+        (root if name == "all" else get_logger(name)).setLevel(logging.DEBUG)
@@ -1,56 +1,61 @@
 "High-level spotting pipeline."
 from __future__ import annotations
-import os
-print("=== PIPELINE MODULE LOADED FROM:", os.path.abspath(__file__), "===")
-import json, shutil, subprocess, tempfile, logging
+import json, os
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
 
 import pandas as pd
 import numpy as np
-import soundfile as sf
 import librosa
 import essentia.standard as es
-from demucs.pretrained import get_model
-from demucs.apply import apply_model
-import torchaudio
 
-from .detectors.yamnet_segmenter import segment_music_regions
+from .audio import AudioBuffer, decode
+from .cache import AnalysisCache, cached
+from .log import configure as configure_logging, get_logger
+from .separation import DEMUCS_MODEL, separate, _load_demucs_model
+from .stages import Stage, run_stages
+from .detectors.yamnet_segmenter import (
+    YAMNET_HANDLE, export_timelines, segment_music_regions, _load_yamnet_model,
+)
+from .incremental import fingerprint, load_run, plan_reuse, save_run
 from .output import get_incremental_path
 from .detectors import (
+    embed_chunks,
     music_probability,
-    tag_chunk,
+    tag_names,
+    tag_scores,
+)
+from .detectors.ast import AST_MODEL, _load_ast_model
+from .detectors.clap import CLAP_CKPT, tags_signature
+from .detectors.m2e_wrapper import (
+    M2E_MODEL, M2E_RATES, m2e_features, moods_from_features, _load_m2e_model,
 )
-from .detectors.m2e_wrapper import global_moods
-
-def _extract_audio(src: str | Path) -> Path:
-    print("=== ENTERED _extract_audio ===")
-    "Return temp mono 44.1 kHz wav path extracted with ffmpeg."
-    if not shutil.which("ffmpeg"):
-        raise FileNotFoundError(
-            "ffmpeg not found. Please install ffmpeg and ensure it is in your PATH."
-        )
-    tmp = Path(tempfile.mkdtemp(prefix="sibyllai_"))
-    wav = tmp / "audio.wav"
-    try:
-        subprocess.run(
-            ["ffmpeg", "-y", "-i", str(src), "-vn",
-             "-acodec", "pcm_s16le", "-ar", "44100", "-ac", "1", str(wav)],
-            check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-        )
-    except subprocess.CalledProcessError as e:
-        raise
-    return wav
 
+log = get_logger("pipeline")
+
+TAGS_IN_CSV = 10  # best-matching CLAP tags listed per segment
+STAGE_WORKERS = {"separate": 1, "detect": 2, "mood": 1}  # pipelined mode defaults
+# MusicProb sources: YAMNet 'Music' frames of the mix over the region (free,
+# they come from segmentation), YAMNet on the separated stem, or windowed AST
+MUSIC_PROB_MODES = ("yamnet", "yamnet-stem", "ast")
+# Demucs policy: "auto" only separates regions where dialogue competes with
+# the music, i.e. at least SPEECH_FRACTION of their YAMNet frames score
+# 'Speech' above SPEECH_THRESH
+SEPARATE_MODES = ("auto", "always", "never")
+SPEECH_THRESH = 0.2
+SPEECH_FRACTION = 0.05
 
 def _bpm_track(y, sr):
-    print("=== ENTERED _bpm_track ===")
     if y.ndim > 1:
         y = librosa.to_mono(y.T)
     return es.RhythmExtractor2013(method="multifeature")(y)[0]
 
 
 def _tc(sec: float, fps: int = 25) -> str:
-    print("=== ENTERED _tc ===")
     frames = int(round(sec * fps))
     h = frames // (3600 * fps)
     m = (frames % (3600 * fps)) // (60 * fps)
@@ -59,113 +64,371 @@ def _tc(sec: float, fps: int = 25) -> str:
     return f"{h:02d}:{m:02d}:{s:02d}:{f:02d}"
 
 
+@dataclass
+class _RunOptions:
+    "Per-run settings shared by the region stages (picklable for pool workers)."
+    out_dir: Path
+    debug_audio: bool = False
+    demucs_opts: dict = field(default_factory=dict)
+    cache: AnalysisCache | None = None
+    music_prob: str = "yamnet"
+
+    def key(self, *parts) -> str | None:
+        return AnalysisCache.key(*parts) if self.cache is not None else None
+
+
+def _separate_stage(region: dict, opts: _RunOptions):
+    i, chunk = region["index"], region["chunk"]
+    region["key"] = opts.key(chunk.samples, chunk.sr)
+    if not region["separate"]:
+        # no competing dialogue: the detectors get the mix itself
+        if opts.debug_audio:
+            chunk.write(opts.out_dir / f"segment_{i}.wav")
+        region["stem"], region["stem_key"] = chunk.to_mono(), region["key"]
+        return region
+    stem_key = opts.key(region["key"], DEMUCS_MODEL, sorted(opts.demucs_opts.items()))
+
+    def _separate():
+        stem = separate(chunk, **opts.demucs_opts).to_mono()
+        return {"samples": stem.samples, "sr": np.array(stem.sr)}
+    try:
+        hit = cached(opts.cache, stem_key, _separate)
+        stem = AudioBuffer(hit["samples"], int(hit["sr"]))
+        if opts.debug_audio:
+            chunk.write(opts.out_dir / f"segment_{i}.wav")
+            stem.write(opts.out_dir / f"segment_{i}_other.wav")
+    except Exception as e:
+        log.warning("Demucs failed for segment %d: %s", i, e)
+        return None
+    region["stem"], region["stem_key"] = stem, stem_key
+    return region
+
+
+def _detect_stage(region: dict, opts: _RunOptions):
+    # Use the separated music stem for all detectors; each detector gets
+    # a view at its native rate, resampled once per region.
+    # With the default "yamnet" MusicProb, region["prob"] is already set.
+    i, stem, stem_key = region["index"], region["stem"], region["stem_key"]
+    try:
+        if opts.music_prob == "ast":
+            region["prob"] = cached(
+                opts.cache, opts.key(stem_key, AST_MODEL, "windowed"),
+                lambda: music_probability(stem.at_rate(16_000).mono(), 16_000, windowed=True))
+        elif opts.music_prob == "yamnet-stem" and region["separate"]:
+            # an unseparated region's "stem" is the mix, already scored
+            yamnet = _load_yamnet_model()
+            region["prob"] = cached(
+                opts.cache, opts.key(stem_key, YAMNET_HANDLE, "music"),
+                lambda: yamnet.music_probability(yamnet.scores(stem)))
+        region["bpm"] = cached(
+            opts.cache, opts.key(stem_key, "essentia:RhythmExtractor2013:multifeature"),
+            lambda: float(_bpm_track(stem.at_rate(44_100).mono(), 44_100)))
+    except Exception as e:
+        log.warning("Detectors failed for segment %d: %s", i, e)
+        return None
+    return region
+
+
+def _mood_stage(region: dict, opts: _RunOptions):
+    # Use the separated music stem for mood detection. Only the MERT
+    # embedding and BTC chord ids are computed (and cached) here; the mood
+    # head runs once over all regions in analyse().
+    i, stem = region["index"], region["stem"]
+    features_key = opts.key(region["stem_key"], M2E_MODEL)
+    features = (opts.cache.get(features_key) if opts.cache else None) or {}
+    miss = not features
+    try:
+        # MERT / BTC inputs come from the region's shared per-rate views
+        views = {rate: stem.at_rate(rate).mono()
+                 for k, rate in M2E_RATES.items() if k not in features}
+        if views:
+            m2e_features(views, None, features)
+    except Exception as e:
+        log.warning("music2emo failed for segment %d: %s", i, e)
+        return region
+    region["m2e"] = features
+    if opts.cache and miss:
+        opts.cache.put(features_key, {k: np.asarray(v) for k, v in features.items()})
+    return region
+
+
+def _clap_embeddings(rows: list, opts: _RunOptions) -> np.ndarray:
+    "CLAP embeddings for all rows, computing the uncached ones in one batch."
+    keys = [opts.key(r["stem_key"], CLAP_CKPT or "default", "clap-audio") for r in rows]
+    embs = [opts.cache.get(k) if opts.cache else None for k in keys]
+    todo = [n for n, e in enumerate(embs) if e is None]
+    if todo:
+        fresh = embed_chunks([rows[n]["stem"].at_rate(48_000).mono() for n in todo], 48_000)
+        for n, e in zip(todo, fresh):
+            embs[n] = opts.cache.put(keys[n], e) if opts.cache else e
+    return np.stack(embs)
+
+
+def _clap_tags(rows: list, opts: _RunOptions) -> list:
+    "Set the CLAP tag scores of *rows*; rows CLAP fails on are dropped."
+    try:
+        sims = tag_scores(_clap_embeddings(rows, opts))
+    except Exception as e:
+        if len(rows) == 1:
+            log.warning("CLAP failed for segment %d: %s", rows[0]["index"], e)
+            return []
+        log.warning("CLAP failed for the batch, retrying segment by segment: %s", e)
+        return [r for row in rows for r in _clap_tags([row], opts)]
+    names = tag_names()
+    for r, s in zip(rows, sims):
+        r["tags"] = dict(zip(names, s))
+    return rows
+
+
+def _init_worker(n_workers: int, music_prob: str):
+    """
+    Process-pool initializer: split the CPU threads and warm the models
+    every region needs once. Demucs loads on a worker's first separation.
+    """
+    import torch
+    configure_logging()   # same per-component debug settings as the parent
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // n_workers))
+    if music_prob == "ast":
+        _load_ast_model()
+    _load_m2e_model()
+
+
+# Worker pool kept across analyse() calls, so a batch starts its workers
+# (and loads their models) once: ((workers, music_prob), executor)
+_pool = None
+
+def _worker_pool(workers: int, music_prob: str) -> ProcessPoolExecutor:
+    global _pool
+    key = (workers, music_prob)
+    if _pool is None or _pool[0] != key:
+        shutdown_workers()
+        _pool = (key, ProcessPoolExecutor(
+            max_workers=workers, mp_context=mp.get_context("spawn"),
+            initializer=_init_worker, initargs=key))
+    return _pool[1]
+
+
+def shutdown_workers() -> None:
+    "Stop the worker processes started by analyse(workers=N), if any."
+    global _pool
+    if _pool is not None:
+        _pool[1].shutdown()
+        _pool = None
+
+
+def _analyse_region(region: dict, opts: _RunOptions):
+    "Run all region stages in a pool worker; the stem comes back for CLAP."
+    region = _separate_stage(region, opts)
+    if region is None:
+        return None
+    region = _detect_stage(region, opts)
+    if region is None:
+        return None
+    region = _mood_stage(region, opts)
+    del region["chunk"]   # the parent already has it; don't pickle it back
+    return region
+
+
 # ─── public API ────────────────────────────────────────────────────────────
-def analyse(src: str | Path, out_dir: str | Path, thr: float = 0.5, fps=25):
+def analyse(src: str | Path, out_dir: str | Path, thr: float = 0.5, fps=25,
+            debug_audio: bool = False, demucs_segment: float | None = None,
+            demucs_overlap: float = 0.25, demucs_shifts: int = 1,
+            pipelined: bool = False, stage_workers: dict | None = None,
+            workers: int = 1, cache_dir: str | Path | None = None,
+            previous: str | Path | None = None, music_prob: str = "yamnet",
+            separate_mode: str = "auto"):
+    """
+    Decode *src* once and analyse its music regions in memory. With
+    *debug_audio* the decoded audio, segments and Demucs stems are also
+    written to *out_dir* for inspection. The demucs_* knobs are passed to
+    `separation.separate`.
+
+    *music_prob* picks the MusicProb source (see MUSIC_PROB_MODES): by
+    default the YAMNet frames already scored for segmentation are averaged
+    over each region; "yamnet-stem" scores the separated stem with YAMNet
+    (unseparated regions keep the mix score) and "ast" runs the windowed
+    AST model on it.
+
+    *separate_mode* decides which regions go through Demucs (see
+    SEPARATE_MODES): with "auto" only those where YAMNet hears speech
+    over the music are separated, the others are analysed from the mix.
+    The decision is recorded in the CSV's Separated column.
+
+    Regions go through the separate → detect → mood stages. With
+    *pipelined* the stages run concurrently (see `stages.run_stages`),
+    *stage_workers* overriding the per-stage thread counts in STAGE_WORKERS.
+    With *workers* > 1 regions are instead fanned out over a process pool
+    whose workers each load their own models once; the pool is reused by
+    later calls with the same workers/music_prob (see `shutdown_workers`).
+
+    With *cache_dir* YAMNet scores, Demucs stems, AST/CLAP/BPM outputs and
+    Music2Emo features are cached by content (see `cache.AnalysisCache`),
+    so re-running on mostly unchanged audio only recomputes edited regions.
+
+    Every run leaves an audio fingerprint and its results in *out_dir*
+    (see `incremental`). With *previous* pointing at such a run, the new
+    audio is aligned against it: previous music regions found intact are
+    carried over with shifted timecodes, and YAMNet and the region stages
+    only run on the material that could not be matched.
+
+    The whole-input YAMNet pass also leaves per-frame timelines and region
+    lists for the classes in TIMELINE_CLASSES (`export_timelines`); an
+    incremental run only scores the changed spans and doesn't write them.
+    """
+    if music_prob not in MUSIC_PROB_MODES:
+        raise ValueError(f"music_prob must be one of {MUSIC_PROB_MODES}, got {music_prob!r}")
+    if separate_mode not in SEPARATE_MODES:
+        raise ValueError(f"separate_mode must be one of {SEPARATE_MODES}, got {separate_mode!r}")
     src = Path(src)
     out_dir = Path(out_dir)
-    print("=== ENTERED analyse ===")
-    print("=== ENTERED ANALYSE FUNCTION (DEBUG MARKER) ===")
-    print(f"[DEBUG] Input file received: {src}")
     if not src.exists():
-        print(f"[ERROR] File does not exist: {src}")
-        return
-    print(f"[DEBUG] File exists: {src}")
+        raise FileNotFoundError(f"File does not exist: {src}")
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    # 1. Extract audio from input (video or audio file)
-    wav = _extract_audio(src)
-    print(f"[DEBUG] Extracted WAV path: {wav}")
-    y, sr = sf.read(str(wav))
+    # 1. Decode audio from input (video or audio file) straight into memory
+    audio = decode(src, sr=44100)
+    log.debug("Decoded %s: %.2fs %s @ %d Hz", src, audio.duration, audio.layout, audio.sr)
+    if debug_audio:
+        audio.write(out_dir / "audio_debug.wav")
+
+    cache = AnalysisCache(cache_dir) if cache_dir is not None else None
+    opts = _RunOptions(
+        out_dir=out_dir, debug_audio=debug_audio, cache=cache, music_prob=music_prob,
+        demucs_opts={"segment": demucs_segment, "overlap": demucs_overlap,
+                     "shifts": demucs_shifts},
+    )
+
+    # models and settings behind this run's rows: a previous run's rows are
+    # only carried over when they match (JSON-stable, compared to run.json)
+    settings = {
+        "music_prob": music_prob, "separate_mode": separate_mode, "thr": float(thr),
+        "yamnet": YAMNET_HANDLE, "demucs": DEMUCS_MODEL, "demucs_opts": opts.demucs_opts,
+        "ast": AST_MODEL if music_prob == "ast" else None,
+        "clap": CLAP_CKPT or "default", "tags": tags_signature(), "m2e": M2E_MODEL,
+    }
 
-    # 2. Segment music regions using YAMNet
-    music_regions = segment_music_regions(wav)
-    print(f"[DEBUG] Detected music regions: {music_regions}")
+    # 2. Segment music regions using YAMNet (only where the audio changed
+    # since the previous run, if there is one)
+    fp = fingerprint(audio)
+    reused, changed = [], [(0.0, audio.duration)]
+    if previous is not None:
+        prev_fp, prev = load_run(previous)
+        if prev.get("settings", {}).get("yamnet") != YAMNET_HANDLE:
+            # its regions came from another segmentation: start from scratch
+            log.info("%s was segmented with another YAMNet model; analysing everything", previous)
+        else:
+            if prev["settings"] != settings:
+                log.info("Settings or models differ from %s; re-analysing its regions", previous)
+            reused, changed = plan_reuse(prev_fp, prev, fp, audio.duration, settings)
+        log.debug("Matched %d regions of %s; changed spans: %s", len(reused), previous, changed)
+    carried = {span: row for span, row in reused if row is not None}
+    # matched regions without results (too short, or failed) are rescored
+    changed = sorted(changed + [span for span, row in reused if row is None])
+    music_regions = list(carried)
+    mix_prob, speech = {}, {}   # span → mean 'Music' score / 'Speech' frame share of the mix
+    for a, b in changed:
+        # a second of context either side so YAMNet sees the edit boundaries
+        a0, b0 = max(0.0, a - 1.0), min(audio.duration, b + 1.0)
+        whole = (a0, b0) == (0.0, audio.duration)
+        part = audio if whole else audio.slice(a0, b0)
+        # scored block by block from the decoded buffer, resampled on the
+        # fly, so long recordings neither grow a 16 kHz copy nor decode twice
+        scores = cached(cache, opts.key(part.samples, part.sr, YAMNET_HANDLE),
+                        lambda: _load_yamnet_model().scores(part))
+        yamnet = _load_yamnet_model()
+        if whole:
+            # speech/singing/applause/silence/SFX timelines from the same pass
+            export_timelines(scores, out_dir)
+        for s, e in segment_music_regions(part, scores=scores):
+            if s + a0 < b and e + a0 > a:
+                span = (max(a, s + a0), min(b, e + a0))
+                mix_prob[span] = yamnet.music_probability(scores, span[0] - a0, span[1] - a0)
+                speech[span] = yamnet.class_fraction(scores, "Speech", SPEECH_THRESH,
+                                                     span[0] - a0, span[1] - a0)
+                music_regions.append(span)
+    music_regions.sort()
+    log.debug("Detected music regions: %s", music_regions)
+    record = {"source": str(src), "duration": audio.duration, "settings": settings,
+              "music_regions": [[float(s), float(e)] for s, e in music_regions], "rows": []}
     if not music_regions:
-        logging.warning("No music detected.")
-        print("INFO: No music regions were detected in the input file. No output files will be generated.")
+        save_run(out_dir, fp, record)
+        log.warning("No music regions were detected in %s; no segment files will be written.", src)
         return
 
-    # 3. For each region, extract audio and run detectors
-    rows = []
+    # 3. Slice each region from the buffer and run it through the stages
+    regions, kept = [], []
     min_duration = 3.0  # seconds
     for i, (start, end) in enumerate(music_regions):
+        if (start, end) in carried:
+            kept.append({**carried[(start, end)], "index": i + 1})
+            continue
         if (end - start) < min_duration:
-            print(f"[WARNING] Skipping segment {i+1} (too short: {end - start:.2f}s)")
+            log.warning("Skipping segment %d (too short: %.2fs)", i + 1, end - start)
             continue
-        start_sample = int(start * sr)
-        end_sample = int(end * sr)
-        chunk = y[start_sample:end_sample]
-        # Ensure chunk is stereo and 44.1kHz for Demucs
-        target_sr = 44100
-        if sr != target_sr:
-            chunk = librosa.resample(chunk, orig_sr=sr, target_sr=target_sr)
-        if chunk.ndim == 1:
-            chunk = np.stack([chunk, chunk], axis=0)
-        elif chunk.shape[0] == 1:
-            chunk = np.vstack([chunk, chunk])
-        # Save as (n_samples, 2) for sf.write
-        chunk = chunk.T
-        segment_wav_path = out_dir / f"segment_{i+1}.wav"
-        sf.write(segment_wav_path, chunk, target_sr)
-        print(f"[DEBUG] Segment {i+1}: {start:.2f}-{end:.2f}s, temp WAV: {segment_wav_path}")
-        # Run Demucs on the segment WAV
-        demucs_out_dir = out_dir / f"segment_{i+1}_demucs"
-        demucs_out_dir.mkdir(exist_ok=True)
+        sep = separate_mode == "always" or (
+            separate_mode == "auto" and speech[(start, end)] >= SPEECH_FRACTION)
+        log.debug("Segment %d: %.2f-%.2fs (speech %.0f%%, %s)", i + 1, start, end,
+                  100 * speech[(start, end)], "separate" if sep else "mix")
+        regions.append({"index": i + 1, "start": start, "end": end,
+                        "chunk": audio.slice(start, end), "prob": mix_prob.get((start, end)),
+                        "separate": sep})
+
+    n_workers = {**STAGE_WORKERS, **(stage_workers or {})}
+    demucs = any(r["separate"] for r in regions)
+    stages = [
+        Stage("separate", partial(_separate_stage, opts=opts), n_workers["separate"],
+              _load_demucs_model if demucs else None),
+        Stage("detect", partial(_detect_stage, opts=opts), n_workers["detect"],
+              _load_ast_model if music_prob == "ast" else None),
+        Stage("mood", partial(_mood_stage, opts=opts), n_workers["mood"], _load_m2e_model),
+    ]
+    if not regions:
+        results = []
+    elif workers > 1:
+        # map() yields in submission order, i.e. timeline order
         try:
-            # Use Demucs CLI for robust file output
-            subprocess.run([
-                "demucs", "--two-stems", "other", "-o", str(demucs_out_dir), str(segment_wav_path)
-            ], check=True)
-            # Demucs outputs to demucs_out_dir/demucs/segment_{i+1}/other.wav
-            demucs_stem_dir = demucs_out_dir / "htdemucs" / segment_wav_path.stem
-            other_stem_path = demucs_stem_dir / "other.wav"
-            if not other_stem_path.exists():
-                # Try 'accompaniment.wav' as fallback
-                other_stem_path = demucs_stem_dir / "accompaniment.wav"
-            if not other_stem_path.exists():
-                print(f"[WARNING] Demucs did not produce an 'other' or 'accompaniment' stem for segment {i+1}.")
-                continue
-            # Load the separated music stem
-            stem_chunk, stem_sr = sf.read(str(other_stem_path))
-            if stem_sr != sr:
-                stem_chunk = librosa.resample(stem_chunk, orig_sr=stem_sr, target_sr=sr)
-            # Use the separated music stem for all detectors
-            prob = music_probability(stem_chunk, sr)
-            tags = tag_chunk(stem_chunk, sr)
-            bpm = _bpm_track(stem_chunk, sr)
-            rows.append({
-                "start": start,
-                "end": end,
-                "prob": prob,
-                "tags": tags,
-                "bpm": bpm,
-            })
-            # Use the separated music stem for mood detection
-            try:
-                mood_result = global_moods(str(other_stem_path))
-            except Exception as e:
-                print(f"[WARNING] music2emo failed for segment {i+1}: {e}")
-                print(f"[WARNING] Segment WAV kept for inspection: {other_stem_path}")
-                continue
-            json_path = out_dir / f"mood_segment_{i+1}.json"
-            with open(json_path, "w") as f:
-                json.dump(mood_result, f, indent=2)
-        except Exception as e:
-            print(f"[WARNING] Demucs failed for segment {i+1}: {e}")
-            print(f"[WARNING] Segment WAV kept for inspection: {segment_wav_path}")
-            continue
+            results = list(_worker_pool(workers, music_prob).map(
+                partial(_analyse_region, opts=opts), regions))
+        except BrokenProcessPool:
+            shutdown_workers()   # a worker died: start afresh for the next input
+            raise
+    else:
+        results = run_stages(regions, stages, threaded=pipelined)
+    fresh = [r for r in results if r is not None]
+
+    # CLAP tags for all new regions in one batched pass
+    if fresh:
+        fresh = _clap_tags(fresh, opts)
+    # Music2Emo mood head for all new regions in one batch
+    moody = [r for r in fresh if "m2e" in r]
+    try:
+        for r, mood in zip(moody, moods_from_features([r["m2e"] for r in moody], thr)):
+            r["mood"] = mood
+    except Exception as e:
+        log.warning("music2emo head failed: %s", e)
+    rows = sorted(fresh + kept, key=lambda r: r["index"])
+    for r in rows:
+        if r.get("mood") is not None:
+            with open(out_dir / f"mood_segment_{r['index']}.json", "w") as f:
+                json.dump(r["mood"], f, indent=2)
 
     # 4. Save per-segment results to CSV
     df = pd.DataFrame(
         [[_tc(r["start"], fps), _tc(r["end"], fps), _tc(r["end"]-r["start"], fps),
-          f'{r["prob"]:.2f}', f'{r["bpm"]:.2f}',
-          ", ".join(f"{k}:{v:.2f}" for k, v in r["tags"].items() if "speech" not in k.lower())]
+          f'{r["prob"]:.2f}', f'{r["bpm"]:.2f}', "yes" if r.get("separate", True) else "no",
+          ", ".join(f"{k}:{v:.2f}" for k, v in sorted(
+              ((k, v) for k, v in r["tags"].items() if "speech" not in k.lower()),
+              key=lambda kv: -kv[1])[:TAGS_IN_CSV])]
          for r in rows],
-        columns=["Start", "End", "Length", "MusicProb", "BPM", "Tags"],
+        columns=["Start", "End", "Length", "MusicProb", "BPM", "Separated", "Tags"],
     )
-    df.to_csv(get_incremental_path(out_dir, "music_segments.csv"), index=False)
-    logging.info("Music segments saved → %s", out_dir / "music_segments.csv")
-
-    # 5. Copy the extracted WAV to outputs for inspection
-    shutil.copy(str(wav), str(Path(out_dir) / "audio_debug.wav"))
-    shutil.rmtree(wav.parent, ignore_errors=True)
+    csv_path = get_incremental_path(out_dir, "music_segments.csv")
+    df.to_csv(csv_path, index=False)
+    record["rows"] = [
+        {"start": float(r["start"]), "end": float(r["end"]), "prob": float(r["prob"]),
+         "bpm": float(r["bpm"]), "separate": bool(r.get("separate", True)),
+         "tags": {k: float(v) for k, v in r["tags"].items()}, "mood": r.get("mood")}
+        for r in rows
+    ]
+    save_run(out_dir, fp, record)
+    log.info("Music segments saved → %s", csv_path)
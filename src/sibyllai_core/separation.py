@@ -0,0 +1,46 @@
+"In-process Demucs source separation with a persistent model."
+from __future__ import annotations
+import numpy as np
+import torch
+from demucs.pretrained import get_model
+from demucs.apply import apply_model
+
+from .audio import AudioBuffer
+
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+DEMUCS_MODEL = "htdemucs"
+
+# Lazy-loaded model
+_model = None
+_model_name = None
+
+def _load_demucs_model(name: str = DEMUCS_MODEL):
+    global _model, _model_name
+    if _model is None or _model_name != name:
+        _model = get_model(name).to(DEVICE).eval()
+        _model_name = name
+    return _model
+
+
+def separate(chunk: AudioBuffer, stem: str = "other", model_name: str = DEMUCS_MODEL,
+             segment: float | None = None, overlap: float = 0.25,
+             shifts: int = 1) -> AudioBuffer:
+    """
+    Return the *stem* source of *chunk* at the model sample rate.
+
+    *segment* (seconds, model default when None), *overlap* and *shifts*
+    are passed to `demucs.apply.apply_model`; the defaults match the
+    ``demucs`` CLI.
+    """
+    model = _load_demucs_model(model_name)
+    y = chunk.at_rate(model.samplerate).stereo()
+    wav = torch.from_numpy(np.ascontiguousarray(y, dtype=np.float32))
+    # Same normalisation as the demucs CLI
+    ref = wav.mean(0)
+    mean, std = ref.mean(), ref.std() + 1e-8
+    wav = (wav - mean) / std
+    with torch.inference_mode():
+        sources = apply_model(model, wav[None], device=DEVICE, shifts=shifts,
+                              split=True, overlap=overlap, segment=segment)[0]
+    out = sources[model.sources.index(stem)] * std + mean
+    return AudioBuffer(out.cpu().numpy(), model.samplerate)
@@ -0,0 +1,92 @@
+"Stage-graph executor: bounded queues between stages, worker threads per stage."
+from __future__ import annotations
+import queue, threading
+from dataclasses import dataclass
+from typing import Callable
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    "One step of the graph. *fn* maps an item to an item, or None to drop it."
+    name: str
+    fn: Callable
+    workers: int = 1
+    setup: Callable | None = None   # run once before any worker starts
+
+
+def run_stages(items, stages: list[Stage], queue_size: int = 2,
+               threaded: bool = True) -> list:
+    """
+    Push *items* through *stages* in order and return the final results in
+    input order (None where a stage dropped the item).
+
+    With *threaded* each stage runs `workers` threads fed by a queue holding
+    at most *queue_size* items, so item N+1 can be in an early stage while
+    item N is in a later one. Torch/TF/NumPy kernels release the GIL, which
+    is where the overlap comes from. Without it, items run one at a time.
+    The first exception raised by a stage is re-raised once all workers
+    have stopped.
+    """
+    items = list(items)
+    for st in stages:
+        if st.setup is not None:
+            st.setup()
+    results = [None] * len(items)
+
+    if not threaded:
+        for n, item in enumerate(items):
+            for st in stages:
+                if item is None:
+                    break
+                item = st.fn(item)
+            results[n] = item
+        return results
+
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    running = [st.workers for st in stages]
+    lock = threading.Lock()
+    errors = []
+
+    def worker(k: int, st: Stage):
+        while True:
+            job = queues[k].get()
+            if job is _DONE:
+                break
+            n, item = job
+            if errors:
+                continue    # drain the queue after a failure
+            try:
+                out = st.fn(item)
+            except BaseException as e:
+                errors.append(e)
+                continue
+            if out is None:
+                continue
+            if k + 1 < len(stages):
+                queues[k + 1].put((n, out))
+            else:
+                results[n] = out
+        with lock:
+            running[k] -= 1
+            last = running[k] == 0
+        if last and k + 1 < len(stages):
+            for _ in range(stages[k + 1].workers):
+                queues[k + 1].put(_DONE)
+
+    threads = [
+        threading.Thread(target=worker, args=(k, st), name=f"{st.name}-{w}", daemon=True)
+        for k, st in enumerate(stages) for w in range(st.workers)
+    ]
+    for t in threads:
+        t.start()
+    for n, item in enumerate(items):
+        queues[0].put((n, item))
+    for _ in range(stages[0].workers):
+        queues[0].put(_DONE)
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return results
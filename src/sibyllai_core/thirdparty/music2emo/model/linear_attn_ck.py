@@ -1,3 +1,4 @@
+import logging
 import os
 import torch
 import torch.nn as nn
@@ -6,6 +7,8 @@ from sklearn import metrics
 from transformers import AutoModelForAudioClassification
 import numpy as np
 
+log = logging.getLogger("sibyllai.music2emo")
+
 class PositionalEncoding(nn.Module):
     def __init__(self, d_model, max_len=100):
         super().__init__()
@@ -24,7 +27,7 @@ class FeedforwardModelAttnCK(nn.Module):
     def __init__(self, input_size, output_size, nhead=8, num_layers=1, dropout_rate=0.1, 
                  num_key = 2, num_chords=158, num_chords_root=14, num_chords_attr=14, 
                  key_emb_dim=4, chord_emb_dim=8, chord_root_emb_dim=4, chord_attr_emb_dim=4):
-        print("=== FeedforwardModelAttnCK __init__ called ===")
+        log.debug("FeedforwardModelAttnCK: building")
         super().__init__()
         self.d_model = 512
 
@@ -1,3 +1,4 @@
+import logging
 import os
 import torch
 import torch.nn as nn
@@ -6,6 +7,8 @@ from sklearn import metrics
 from transformers import AutoModelForAudioClassification
 import numpy as np
 
+log = logging.getLogger("sibyllai.music2emo")
+
 class PositionalEncoding(nn.Module):
     def __init__(self, d_model, max_len=100):
         super().__init__()
@@ -24,7 +27,7 @@ class FeedforwardModelMTAttnCK(nn.Module):
     def __init__(self, input_size, output_size_classification, output_size_regression, nhead=8, num_layers=1, dropout_rate=0.1, 
                  num_key = 2, num_chords=158, num_chords_root=14, num_chords_attr=14, 
                  key_emb_dim=4, chord_emb_dim=8, chord_root_emb_dim=4, chord_attr_emb_dim=4):
-        print("=== FeedforwardModelMTAttnCK __init__ called ===")
+        log.debug("FeedforwardModelMTAttnCK: building")
         super().__init__()
         self.d_model = 512
 
@@ -90,9 +93,9 @@ class FeedforwardModelMTAttnCK(nn.Module):
 
         chord_embedding_cls = chord_embedding_transformed[:,0,:]  # Shape: (batch_size, chord_emb_dim)
         
-        print("x_mert shape:", x_mert.shape)
-        print("chord_embedding_cls shape:", chord_embedding_cls.shape)
-        print("key_embedding shape:", key_embedding.shape)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("x_mert %s, chord_embedding_cls %s, key_embedding %s", tuple(x_mert.shape),
+                      tuple(chord_embedding_cls.shape), tuple(key_embedding.shape))
         x_mert_flat = x_mert.mean(dim=1)  # [batch, 1536]
         combined_features = torch.cat((x_mert_flat, chord_embedding_cls, key_embedding), dim=1)
         # Input projection
@@ -1,31 +1,31 @@
 # music2emo/music2emo.py
 # ────────────────────────────────────────────────────────────────────────────
 import os, json, shutil, logging, warnings
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Tuple
 
 import numpy as np
 import torch, torchaudio
 import torchaudio.transforms as T
-import mir_eval, pretty_midi as pm
+import mir_eval
 from transformers import Wav2Vec2FeatureExtractor, AutoModel
-from music21 import converter
 from tqdm import tqdm
 
 from .utils import logger
 from .utils.btc_model         import BTC_model
 from .utils.hparams           import HParams
-from .utils.mir_eval_modules  import audio_file_to_features, idx2voca_chord
+from .utils.mir_eval_modules  import audio_to_features, idx2voca_chord
 from .utils.mert              import FeatureExtractorMERT
 from .model.linear_mt_attn_ck import FeedforwardModelMTAttnCK
 
 # ─── housekeeping ──────────────────────────────────────────────────────────
 logging.getLogger("transformers.modeling_utils").setLevel(logging.ERROR)
+log = logging.getLogger("sibyllai.music2emo")   # diagnostics, DEBUG level
 warnings.filterwarnings("ignore", category=UserWarning)
 
 PITCH_CLASS      = ['C','C#','D','D#','E','F','F#','G','G#','A','A#','B']
 pitch_num_dic    = {p:i for i,p in enumerate(PITCH_CLASS)}
-minor_major_dic2 = {'Db':'C#','Eb':'D#','Gb':'F#','Ab':'G#','Bb':'A#'}
 
 shift_major_dic  = pitch_num_dic
 shift_minor_dic  = {
@@ -33,37 +33,100 @@ shift_minor_dic  = {
 }
 
 segment_duration = 30        # seconds
-resample_rate    = 24_000
+resample_rate    = 24_000    # MERT input
+chord_rate       = 22_050    # BTC input (mp3.song_hz of run_config.yaml)
 is_split         = True
-# ────────────────────────────────────────────────────────────────────────────
-def sanitize_key_signature(key:str)->str:
-    return key.replace('-', 'b')
+mert_layers      = (5, 6)    # hidden_states[1:] indices the mood head was trained on
+cqt_backend      = os.environ.get("MUSIC2EMO_CQT", "librosa")  # or "nnaudio" (torch)
+
+# ─── in-memory key estimation / chord encoding ─────────────────────────────
+# Krumhansl–Kessler probe-tone profiles, tonic first. Upstream app.py gets
+# the key from music21's analyze('key') on a MIDI rendering of the .lab
+# file, i.e. a duration-weighted pitch-class profile of the chords; this is
+# the same correlation done directly on the BTC frame ids.
+KK_MAJOR = np.array([6.35,2.23,3.48,2.33,4.38,4.09,2.52,5.19,2.39,3.66,2.29,2.88])
+KK_MINOR = np.array([6.33,2.68,3.52,5.38,2.60,3.53,2.54,4.75,3.98,2.69,3.34,3.17])
+MODES    = ("major","minor")    # x_key index
+max_chord_sequence = 100        # chord changes fed to the mood head
+
+def _zscore(x:np.ndarray)->np.ndarray:
+    x = x - x.mean(axis=-1, keepdims=True)
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+# (24,12): row m*12 + t is mode m with tonic pitch class t
+_KEY_PROFILES = _zscore(np.stack([np.roll(p,t) for p in (KK_MAJOR,KK_MINOR) for t in range(12)]))
+
+@lru_cache(maxsize=1)
+def _chord_tables()->Tuple[np.ndarray,np.ndarray]:
+    """
+    (chroma, ids) lookup tables over the BTC vocabulary (`idx2voca_chord`):
+    chroma is (170,12), each chord's pitch classes, and ids (12,3,170) the
+    chord.json / chord_root.json / chord_attr.json ids of each chord
+    transposed down by each shift (to C major / A minor, as upstream
+    normalises its .lab files).
+    """
+    data = Path(__file__).resolve().parent/"inference/data"
+    chord_to_idx, root_to_idx, attr_to_idx = (
+        json.loads((data/f).read_text()) for f in ("chord.json","chord_root.json","chord_attr.json"))
+    voca   = idx2voca_chord()
+    chroma = np.zeros((len(voca),12), dtype=np.float32)
+    ids    = np.zeros((12,3,len(voca)), dtype=np.int64)
+    for i, label in voca.items():
+        if label in {"N","X"}:
+            ids[:,0,i] = chord_to_idx[label]    # root / attr stay "N" (0)
+            continue
+        root, _, quality = label.partition(":")
+        quality = quality or "maj"
+        root    = pitch_num_dic[root]
+        chroma[i] = np.roll(mir_eval.chord.quality_to_bitmap(quality), root)
+        # minmaj7 has no id in the mood model's vocabulary: keep its triad
+        quality = quality if quality in attr_to_idx else "min"
+        for shift in range(12):
+            name = PITCH_CLASS[(root-shift)%12]
+            ids[shift,:,i] = (chord_to_idx[name if quality=="maj" else f"{name}:{quality}"],
+                              root_to_idx[name], attr_to_idx[quality])
+    return chroma, ids
 
-def normalize_chord(lab_path:str, key:str, key_type:str='major')->List[str]:
-    if key == "None":
-        shift = 0
+def estimate_key(chords:np.ndarray)->Tuple[int,str]|None:
+    """
+    (tonic pitch class, "major"|"minor") of BTC frame-level chord ids
+    *chords*, or None when no chord was heard.
+    """
+    chroma, _ = _chord_tables()
+    profile   = np.bincount(np.asarray(chords).ravel(), minlength=len(chroma)) @ chroma
+    if not profile.any():
+        return None
+    best = int(np.argmax(_KEY_PROFILES @ _zscore(profile)))
+    return best % 12, MODES[best // 12]
+
+def encode_chords(chords:np.ndarray)->Tuple[np.ndarray,np.ndarray,np.ndarray,np.ndarray]:
+    """
+    Mood-model inputs from BTC frame-level chord ids: x_chord, x_chord_root
+    and x_chord_attr for the first `max_chord_sequence` chord changes,
+    transposed to C major / A minor (zero padded), and x_key, the mode.
+    """
+    chords = np.asarray(chords, dtype=np.int64).ravel()
+    key    = estimate_key(chords)
+    if key is None:
+        shift, mode = 0, "major"
     else:
-        key   = key.title()
-        key   = minor_major_dic2.get(key, key)
-        shift = shift_major_dic[key] if key_type=="major" else shift_minor_dic[key]
-
-    out=[]
-    for line in Path(lab_path).read_text().splitlines():
-        if not line.strip(): continue
-        s,e,ch=line.split()
-        if ch in {"N","X"}:
-            nx = ch
-        elif ":" in ch:
-            root,attr=ch.split(":")
-            nx=f"{PITCH_CLASS[(pitch_num_dic[root]-shift)%12]}:{attr}"
-        else:
-            nx=PITCH_CLASS[(pitch_num_dic[ch]-shift)%12]
-        out.append(f"{s} {e} {nx}\n")
-    return out
+        tonic, mode = key
+        shift = (shift_major_dic if mode=="major" else shift_minor_dic)[PITCH_CLASS[tonic]]
+    log.debug("estimated key: %s %s", PITCH_CLASS[key[0]] if key else None, mode)
+    changes = chords[np.r_[True, chords[1:]!=chords[:-1]]] if len(chords) else chords
+    ids     = np.zeros((3,max_chord_sequence), dtype=np.int64)
+    changes = changes[:max_chord_sequence]
+    ids[:,:len(changes)] = _chord_tables()[1][shift][:,changes]
+    return ids[0], ids[1], ids[2], np.array([MODES.index(mode)])
+
+@lru_cache(maxsize=8)
+def _resampler(sr:int, target:int)->T.Resample:
+    # building the sinc kernel is the expensive part; reuse it per rate pair
+    return T.Resample(sr,target)
 
 def resample_waveform(wav:torch.Tensor, sr:int, target:int)->Tuple[torch.Tensor,int]:
     if sr==target: return wav, sr
-    return T.Resample(sr,target)(wav), target
+    return _resampler(sr,target)(wav), target
 
 def split_audio(wav:torch.Tensor, sr:int)->List[torch.Tensor]:
     seg_len=segment_duration*sr
@@ -72,7 +135,7 @@ def split_audio(wav:torch.Tensor, sr:int)->List[torch.Tensor]:
 # ────────────────────────────────────────────────────────────────────────────
 class Music2emo:
     def __init__(self, model_weights:str="saved_models/J_all.ckpt"):
-        print("=== Music2emo __init__ called ===")
+        log.debug("Music2emo: loading models")
         self.device=torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
         root = Path(__file__).resolve().parent
@@ -82,8 +145,7 @@ class Music2emo:
         for p in (self.ckpt_mood,self.ckpt_btc,self.hparams):
             if not p.exists(): raise FileNotFoundError(p)
 
-        self.feat_ext = FeatureExtractorMERT("m-a-p/MERT-v1-95M",
-                                             device=self.device, sr=resample_rate)
+        self._feat_ext = None   # MERT, loaded on first use (see feat_ext)
 
         # mood / val-aro model
         self.mood_model = FeedforwardModelMTAttnCK(1536,56,2)
@@ -107,68 +169,148 @@ class Music2emo:
         self.mood_names=[t.replace("mood/theme---","")
                          for t in np.load(tag_file)[127:]]
 
+    def load_mert(self)->FeatureExtractorMERT:
+        "Load MERT now rather than on the first embedding (e.g. to warm a worker)."
+        return self.feat_ext
+
+    @property
+    def feat_ext(self)->FeatureExtractorMERT:
+        # only layers 5/6 are used, so the transformer stops after layer 6;
+        # not loaded at all by callers that only run the head on features
+        if self._feat_ext is None:
+            self._feat_ext = FeatureExtractorMERT("m-a-p/MERT-v1-95M",
+                                                  device=self.device, sr=resample_rate,
+                                                  layers=mert_layers, truncate=True)
+        return self._feat_ext
+
     # ────────────────────────────────────────────────────────────────────────
-    def _mert_embed(self, wav:torch.Tensor, sr:int)->np.ndarray:
-        segs = split_audio(wav,sr) if is_split else [wav]
-        embs=[]
-        for seg in segs:
-            tmp=self.feat_ext.extract_features_from_segment(seg,sr)
-            if tmp.shape[0]>=7:
-                sel=np.concatenate([tmp[:,5,:],tmp[:,6,:]],axis=1)  # (1,1536)
-            else:                                                   # fallback
-                sel=np.tile(tmp.mean(axis=0,keepdims=True), (1,2))  # (1,1536)
-            embs.append(sel.squeeze())
-        return np.mean(embs,axis=0).astype(np.float32)
+    def _mert_embed_many(self, wavs:List[torch.Tensor], sr:int)->List[np.ndarray]:
+        # every cue's 30 s segments go through MERT together
+        segs  = [split_audio(w,sr) if is_split else [w] for w in wavs]
+        flat  = [seg for cue in segs for seg in cue]
+        tmp   = self.feat_ext.extract_features_batch(flat,sr).reshape(len(flat),-1)  # (n_seg,1536)
+        ends  = np.cumsum([len(cue) for cue in segs])
+        return [tmp[e-len(cue):e].mean(axis=0,keepdims=True).astype(np.float32)   # (1,1536)
+                for e,cue in zip(ends,segs)]
 
     # ────────────────────────────────────────────────────────────────────────
-    def _btc_chord_sequence(self, audio:str)->np.ndarray:
-        feat,pps,_ = audio_file_to_features(audio,self.hp)
+    def _btc_chord_sequence(self, wav:np.ndarray, sr:int, batch_blocks:int=64)->np.ndarray:
+        feat,pps,_ = audio_to_features(wav,sr,self.hp,backend=cqt_backend)
         feat       = ((feat.T - self.btc_mean) / self.btc_std)    # (T, F)
-        # pad to multiple of 108
+        n_frames   = len(feat)
+        # pad to multiple of 108 and fold into a (n_blk, 108, F) batch
         pad = (-len(feat)) % self.n_timestep
         if pad: feat = np.pad(feat,((0,pad),(0,0)))
-        feat_t = torch.tensor(feat,dtype=torch.float32,device=self.device)
-        n_blk  = feat_t.shape[0] // self.n_timestep
-        preds  = []
+        blocks = torch.tensor(feat,dtype=torch.float32,device=self.device)
+        blocks = blocks.view(-1,self.n_timestep,feat.shape[1])
 
-        with torch.no_grad():
-            for b in range(n_blk):
-                blk = feat_t[b*self.n_timestep:(b+1)*self.n_timestep].unsqueeze(0)
-                attn,_  = self.btc.self_attn_layers(blk)
-                pred,_  = self.btc.output_layer(attn)          # (1,108)
-                preds.extend(pred.squeeze().tolist())
-        preds = np.array(preds,dtype=np.int64)
-        return preds[:100] if len(preds)>=100 else np.pad(preds,(0,100-len(preds)))
+        with torch.inference_mode():
+            preds = [self.btc.output_layer(self.btc.self_attn_layers(blocks[b:b+batch_blocks])[0])[0]
+                     for b in range(0,len(blocks),batch_blocks)]    # (n,108) each
+        # frame-level ids over the whole cue (the padding is dropped): the
+        # key is estimated from all of them, see encode_chords
+        return torch.cat(preds).reshape(-1)[:n_frames].cpu().numpy().astype(np.int16)
 
     # ────────────────────────────────────────────────────────────────────────
-    def predict(self, audio:str, threshold:float=0.5)->dict:
-        # 1) waveform + MERT embedding --------------------------------------
-        wav, sr = torchaudio.load(audio)
-        wav = wav.mean(0)                    # collapse to mono (time,)
-        wav, sr = resample_waveform(wav, sr, resample_rate)
-        wav = wav.squeeze()                  # ensure 1D
-        print("wav shape before _mert_embed:", wav.shape)  # debug print
-        mert = torch.tensor(
-            self._mert_embed(wav, sr), dtype=torch.float32, device=self.device
-        )
+    def predict(self, audio, threshold:float=0.5, sr:int|None=None,
+                features:dict|None=None)->dict:
+        """
+        *audio* is a file path, or a mono / (chan, time) array sampled at *sr*.
+        *features* may carry a precomputed "mert" embedding and/or "chords"
+        (BTC frame-level ids) array, which are then not recomputed; missing ones are added to it.
+        """
+        if isinstance(audio, (str, os.PathLike)):
+            wav, sr = torchaudio.load(str(audio))   # the only decode
+            audio = wav.numpy()
+        elif sr is None:
+            raise ValueError("sr is required for array input")
+        return self.predict_array(audio, sr, threshold, features)
+
+    def predict_array(self, wav, sr:int, threshold:float=0.5,
+                      features:dict|None=None)->dict:
+        "`predict` for an already decoded mono / (chan, time) array at *sr*."
+        return self.predict_many([wav], sr, threshold,
+                                 None if features is None else [features])[0]
+
+    def predict_many(self, wavs, sr, threshold:float=0.5,
+                     features:List[dict]|None=None)->List[dict]:
+        """
+        `predict_array` for many cues: *sr* is one rate or one per cue and
+        *features* one dict per cue (see `predict`). Features come from
+        `features_many`, then the mood head runs once over all cues.
+        """
+        return self.predict_features(self.features_many(wavs, sr, features), threshold)
+
+    def features_many(self, wavs, sr, features:List[dict]|None=None)->List[dict]:
+        """
+        Fill one features dict per cue with its "mert" embedding and
+        "chords" ids (those already present are kept) and return them.
+        A cue is a waveform at *sr*, or a {rate: mono array} dict of views
+        already resampled by the caller; MERT takes the `resample_rate`
+        (24 kHz) view and BTC the `chord_rate` (22.05 kHz) one, and any
+        missing rate is resampled here. MERT segments from all cues are
+        embedded in shared batches.
+        """
+        srs      = list(sr) if isinstance(sr, (list, tuple)) else [sr]*len(wavs)
+        features = [{} for _ in wavs] if features is None else features
+        views    = []   # per cue: {rate: mono (time,) float32}
+        for w, r in zip(wavs, srs):
+            if isinstance(w, dict):
+                views.append({k: np.asarray(v, dtype=np.float32) for k, v in w.items()})
+            else:
+                w = np.asarray(w, dtype=np.float32)
+                views.append({r: w.mean(0) if w.ndim > 1 else w})   # collapse to mono (time,)
+
+        def view(n:int, rate:int)->Tuple[np.ndarray,int]:
+            # cue n at *rate* when given, else its first view and that view's rate
+            r = rate if rate in views[n] else next(iter(views[n]))
+            return views[n][r], r
+
+        # 1) MERT embeddings ------------------------------------------------
+        todo = [n for n,f in enumerate(features) if "mert" not in f]
+        if todo:
+            wav24 = [resample_waveform(torch.from_numpy(y), r, resample_rate)[0]
+                     for y, r in (view(n, resample_rate) for n in todo)]
+            for n, emb in zip(todo, self._mert_embed_many(wav24, resample_rate)):
+                features[n]["mert"] = emb
+
+        # 2) BTC chord ids per frame (key and encoding: predict_features) --
+        for n, f in enumerate(features):
+            if "chords" not in f:
+                f["chords"] = self._btc_chord_sequence(*view(n, chord_rate))
+        return features
+
+    def predict_features(self, features:List[dict], threshold:float=0.5)->List[dict]:
+        """
+        Run the mood head once over many cues' features (see
+        `features_many`): embeddings, key-normalised chord sequences and
+        the mode estimated from the chords (`encode_chords`) are collated
+        into one batch. Returns one mood dict per cue.
+        """
+        if not features:
+            return []
+        mert = torch.tensor(np.stack([np.asarray(f["mert"],dtype=np.float32).reshape(1,-1)
+                                      for f in features]),
+                            dtype=torch.float32, device=self.device)          # (N,1,1536)
+        chord, root, attr, mode = (torch.tensor(np.stack(x), dtype=torch.long, device=self.device)
+                                   for x in zip(*(encode_chords(f["chords"]) for f in features)))
+                                   # (N,100) x3, (N,1)
+        if log.isEnabledFor(logging.DEBUG):   # .item() syncs the device
+            log.debug("chord roots max %d / %d, attrs max %d / %d, minor %d of %d",
+                      root.max().item(), self.mood_model.chord_root_embedding.num_embeddings,
+                      attr.max().item(), self.mood_model.chord_attr_embedding.num_embeddings,
+                      mode.sum().item(), len(features))
 
-        # 2) chord ids (root/attr simplified = same ids) --------------------
-        btc_chord_ids = self._btc_chord_sequence(audio)
-        mapped_chord_ids = [idx % 14 for idx in btc_chord_ids]
-        chord_ids = torch.tensor(mapped_chord_ids, dtype=torch.long, device=self.device)
-        print(f"chord_ids min: {chord_ids.min().item()}, max: {chord_ids.max().item()}, shape: {chord_ids.shape}")
-        print(f"mood_model.chord_root_embedding.num_embeddings: {self.mood_model.chord_root_embedding.num_embeddings}")
-        mode      = torch.zeros((1,1),dtype=torch.long,device=self.device) # major
-
-        inp = {"x_mert":        mert.unsqueeze(0),
-               "x_chord":       chord_ids.unsqueeze(0),
-               "x_chord_root":  chord_ids.unsqueeze(0),
-               "x_chord_attr":  chord_ids.unsqueeze(0),
+        inp = {"x_mert":        mert,
+               "x_chord":       chord,
+               "x_chord_root":  root,
+               "x_chord_attr":  attr,
                "x_key":         mode}
 
         with torch.no_grad():
-            cls,reg = self.mood_model({k:v.to(self.device) for k,v in inp.items()})
-        probs      = torch.sigmoid(cls).squeeze().cpu().numpy()
-        moods      = [self.mood_names[i] for i,p in enumerate(probs) if p>threshold]
-        val,aro    = reg.squeeze().cpu().tolist()
-        return {"valence":val,"arousal":aro,"moods":moods}
+            cls,reg = self.mood_model(inp)
+        probs      = torch.sigmoid(cls).cpu().numpy()                         # (N,56)
+        val_aro    = reg.cpu().numpy()                                        # (N,2)
+        return [{"valence":float(val),"arousal":float(aro),
+                 "moods":[self.mood_names[i] for i,p in enumerate(pr) if p>threshold]}
+                for pr,(val,aro) in zip(probs,val_aro)]
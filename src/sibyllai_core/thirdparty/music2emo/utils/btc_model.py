@@ -2,7 +2,10 @@ from .transformer_modules import *
 from .transformer_modules import _gen_timing_signal, _gen_bias_mask
 from .hparams import HParams
 
+import logging
+
 use_cuda = torch.cuda.is_available()
+log = logging.getLogger("sibyllai.music2emo")
 
 class self_attention_block(nn.Module):
     def __init__(self, hidden_size, total_key_depth, total_value_depth, filter_size, num_heads,
@@ -137,7 +140,7 @@ class bi_directional_self_attention_layers(nn.Module):
 
 class BTC_model(nn.Module):
     def __init__(self, config):
-        print("=== BTC_model __init__ called ===")
+        log.debug("BTC_model: building")
         super(BTC_model, self).__init__()
 
         self.timestep = config['timestep']
@@ -1,19 +1,29 @@
 # music2emo/utils/mert.py
+import logging
+
 import numpy as np
 import torch
 from transformers import Wav2Vec2FeatureExtractor, AutoModel
 
 
+log = logging.getLogger("sibyllai.music2emo")
+
+
 class FeatureExtractorMERT:
     """
     Lightweight wrapper around m-a-p/MERT-v1-95M that returns layer-wise
     embeddings (12 × 768 per segment).
+
+    With *layers* only those transformer layers (0-based, i.e. indices into
+    ``hidden_states[1:]``) are time-averaged and returned; *truncate* also
+    drops the layers after the last one needed, so they are never run.
     """
 
     def __init__(self, model_name: str = "m-a-p/MERT-v1-95M",
                  device: str | torch.device | None = None,
-                 sr: int = 24_000) -> None:
-        print("=== FeatureExtractorMERT __init__ called ===")
+                 sr: int = 24_000, layers: tuple[int, ...] | None = None,
+                 truncate: bool = False) -> None:
+        log.debug("FeatureExtractorMERT: loading %s", model_name)
         self.sr   = sr
         self.name = model_name
 
@@ -31,6 +41,12 @@ class FeatureExtractorMERT:
             self.name, trust_remote_code=True
         )
 
+        self.layers = None if layers is None else tuple(layers)
+        if self.layers is not None and truncate:
+            encoder = self.model.encoder
+            encoder.layers = encoder.layers[:max(self.layers) + 1]
+        self.model.eval()
+
     # --------------------------------------------------------------------- #
     #                                PUBLIC                                 #
     # --------------------------------------------------------------------- #
@@ -41,36 +57,82 @@ class FeatureExtractorMERT:
         save_path: str | None = None,
     ) -> np.ndarray:
         """
-        Return array with shape **(1, 12, 768)**.
-        If *save_path* is given the array is additionally written to disk.
+        Return array with shape **(1, 12, 768)**, or (1, len(layers), 768)
+        with *layers*. If *save_path* is given the array is additionally
+        written to disk.
         """
-        # ───  ensure 1-D (samples)  ───────────────────────────────────────
-        if segment.ndim == 1:
-            pass  # already correct
-        elif segment.ndim == 2:
-            segment = segment.mean(0)  # collapse to mono, 1D
-        elif segment.ndim > 2:
-            segment = segment.squeeze()
-            if segment.ndim > 1:
-                segment = segment.mean(0)
-        else:
-            raise ValueError(f"Unexpected audio shape {segment.shape}")
+        hidden = self.extract_features_batch([segment], sample_rate)
 
-        segment = segment.float().to(self.device)
+        if save_path:
+            np.save(save_path, hidden)
 
-        inputs = self.processor(
-            segment, sampling_rate=sample_rate, return_tensors="pt"
-        )
-        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        return hidden
 
-        with torch.no_grad():
-            outs = self.model(**inputs, output_hidden_states=True)
+    def extract_features_batch(
+        self,
+        segments: list,             # 1-D / 2-D tensors or arrays
+        sample_rate: int,
+        batch_size: int | None = None,
+    ) -> np.ndarray:
+        """
+        Return array with shape **(N, 12, 768)** (or (N, len(layers), 768))
+        for N segments run *batch_size* at a time (default: `batch_size()`).
+        Only segments of equal length share a batch (a cue's 30 s segments;
+        a shorter tail runs on its own): MERT's conv front-end normalises
+        over time, so zero padding would change a shorter segment's features.
+        """
+        segs = [self._mono(s) for s in segments]
+        batch_size = batch_size or self.batch_size()
+        by_len = {}
+        for n, seg in enumerate(segs):
+            by_len.setdefault(len(seg), []).append(n)
+        out = [None] * len(segs)
+        for group in by_len.values():
+            for b in range(0, len(group), batch_size):
+                idx = group[b:b + batch_size]
+                inputs = self.processor(
+                    [segs[n] for n in idx], sampling_rate=sample_rate, return_tensors="pt"
+                )
+                inputs = {k: v.to(self.device) for k, v in inputs.items()}
+                if self.layers is None:
+                    hidden = self._all_layers(inputs)         # (B, 12, 768)
+                else:
+                    hidden = self._selected_layers(inputs)    # (B, L, 768)
+                for n, h in zip(idx, hidden.cpu().numpy()):
+                    out[n] = h
+        return np.stack(out)
 
-        hidden = torch.stack(outs.hidden_states[1:], dim=0)  # (12, B, T, 768)
-        hidden = hidden.mean(dim=2).permute(1, 0, 2)         # (B, 12, 768)
-        hidden = hidden.cpu().numpy()
+    def batch_size(self, per_segment: int = 512 << 20) -> int:
+        "30 s segments per forward pass: what fits in half the free GPU memory, 4 on CPU."
+        device = torch.device(self.device)
+        if device.type == "cuda":
+            free, _ = torch.cuda.mem_get_info(device)
+            return max(1, int(free // 2 // per_segment))
+        return 4
 
-        if save_path:
-            np.save(save_path, hidden)
+    # --------------------------------------------------------------------- #
+    #                               INTERNAL                                #
+    # --------------------------------------------------------------------- #
+    @staticmethod
+    def _mono(segment) -> np.ndarray:
+        "1-D float32 numpy copy of a 1-D or (chan, time) segment."
+        segment = torch.as_tensor(segment)
+        if segment.ndim > 2:
+            segment = segment.squeeze()
+        if segment.ndim == 2:
+            segment = segment.mean(0)  # collapse to mono, 1D
+        if segment.ndim != 1:
+            raise ValueError(f"Unexpected audio shape {tuple(segment.shape)}")
+        return segment.float().cpu().numpy()
 
-        return hidden
+    def _all_layers(self, inputs: dict) -> torch.Tensor:
+        with torch.no_grad():
+            outs = self.model(**inputs, output_hidden_states=True)
+        return torch.stack([h.mean(1) for h in outs.hidden_states[1:]], dim=1)
+
+    def _selected_layers(self, inputs: dict) -> torch.Tensor:
+        # no hooks on the shared encoder layers: mood workers may run this
+        # concurrently; with truncate there are only a few states anyway
+        with torch.no_grad():
+            outs = self.model(**inputs, output_hidden_states=True)
+        return torch.stack([outs.hidden_states[i + 1].mean(1) for i in self.layers], dim=1)
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 import numpy as np
 import librosa
 import mir_eval
@@ -28,23 +30,44 @@ def idx2voca_chord():
 
 def audio_file_to_features(audio_file, config):
     original_wav, sr = librosa.load(audio_file, sr=config.mp3['song_hz'], mono=True)
-    currunt_sec_hz = 0
-    while len(original_wav) > currunt_sec_hz + config.mp3['song_hz'] * config.mp3['inst_len']:
-        start_idx = int(currunt_sec_hz)
-        end_idx = int(currunt_sec_hz + config.mp3['song_hz'] * config.mp3['inst_len'])
-        tmp = librosa.cqt(original_wav[start_idx:end_idx], sr=sr, n_bins=config.feature['n_bins'], bins_per_octave=config.feature['bins_per_octave'], hop_length=config.feature['hop_length'])
-        if start_idx == 0:
-            feature = tmp
-        else:
-            feature = np.concatenate((feature, tmp), axis=1)
-        currunt_sec_hz = end_idx
-    tmp = librosa.cqt(original_wav[currunt_sec_hz:], sr=sr, n_bins=config.feature['n_bins'], bins_per_octave=config.feature['bins_per_octave'], hop_length=config.feature['hop_length'])
-    feature = np.concatenate((feature, tmp), axis=1)
-    feature = np.log(np.abs(feature) + 1e-6)
-    feature_per_second = config.mp3['inst_len'] / config.model['timestep']
+    return audio_to_features(original_wav, sr, config)
+
+def audio_to_features(original_wav, sr, config, backend="librosa"):
+    # in-memory counterpart of audio_file_to_features for already decoded mono audio.
+    # The CQT is taken over the whole signal in one pass (linear in length, no
+    # edge effects at slice boundaries); backend="nnaudio" computes it with
+    # nnAudio's torch CQT instead, on the GPU when there is one.
+    if sr != config.mp3['song_hz']:
+        original_wav = librosa.resample(original_wav, orig_sr=sr, target_sr=config.mp3['song_hz'])
+        sr = config.mp3['song_hz']
+    original_wav = np.ascontiguousarray(original_wav, dtype=np.float32)
+    if backend == "nnaudio":
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        cqt = _nnaudio_cqt(sr, config.feature['n_bins'], config.feature['bins_per_octave'],
+                           config.feature['hop_length'], device)
+        with torch.inference_mode():
+            feature = cqt(torch.from_numpy(original_wav).to(device))[0].cpu().numpy()
+    elif backend == "librosa":
+        feature = np.abs(librosa.cqt(original_wav, sr=sr, n_bins=config.feature['n_bins'], bins_per_octave=config.feature['bins_per_octave'], hop_length=config.feature['hop_length']))
+    else:
+        raise ValueError(f"unknown CQT backend {backend!r}")
+    feature += 1e-6
+    np.log(feature, out=feature)
+    # seconds per frame: one hop of the single CQT (10 s / 108 frames only
+    # held for the old per-10 s slicing)
+    feature_per_second = config.feature['hop_length'] / config.mp3['song_hz']
     song_length_second = len(original_wav)/config.mp3['song_hz']
     return feature, feature_per_second, song_length_second
 
+@lru_cache(maxsize=4)
+def _nnaudio_cqt(sr, n_bins, bins_per_octave, hop_length, device):
+    # CQT2010v2 follows librosa's downsampling algorithm, so its magnitudes
+    # approximate librosa.cqt's closely; the kernels are built once
+    from nnAudio.features import CQT2010v2
+    return CQT2010v2(sr=sr, hop_length=hop_length, n_bins=n_bins,
+                     bins_per_octave=bins_per_octave, output_format="Magnitude",
+                     verbose=False).to(device)
+
 # Audio files with format of wav and mp3
 def get_audio_paths(audio_dir):
     return [os.path.join(root, fname) for (root, dir_names, file_names) in os.walk(audio_dir, followlinks=True)
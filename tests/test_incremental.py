@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from sibyllai_core.audio import AudioBuffer
+from sibyllai_core.incremental import (
+    FP_HOP_S, FP_SR, FingerprintIndex, fingerprint, plan_reuse,
+)
+
+
+def _music(seconds, seed):
+    "A few slowly wobbling partials plus noise, at the fingerprint rate."
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * FP_SR)) / FP_SR
+    y = sum(np.sin(2 * np.pi * f * t * (1 + 0.01 * np.sin(t * rng.uniform(0.1, 2))))
+            for f in rng.uniform(300, 1800, size=8))
+    return (y + 0.3 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def edit():
+    "Old cut A|B|C (30/20/40 s); new cut D|A|C: 15 s inserted, B removed."
+    a, b, c, d = (_music(s, seed) for seed, s in enumerate((30, 20, 40, 15)))
+    old = AudioBuffer.from_array(np.concatenate([a, b, c]), FP_SR)
+    new = AudioBuffer.from_array(np.concatenate([d, a, c]), FP_SR)
+    return fingerprint(old), fingerprint(new), new.duration
+
+
+def test_align_finds_shift(edit):
+    old_fp, new_fp, _ = edit
+    index = FingerprintIndex(new_fp)
+    to_frame = lambda t: int(round(t / FP_HOP_S))
+    # A moved from 0 s to 15 s, C from 50 s to 45 s, B is gone
+    assert index.align(old_fp, to_frame(2), to_frame(28)) * FP_HOP_S == pytest.approx(15, abs=0.05)
+    assert index.align(old_fp, to_frame(55), to_frame(85)) * FP_HOP_S == pytest.approx(-5, abs=0.05)
+    assert index.align(old_fp, to_frame(32), to_frame(48)) is None
+
+
+def test_plan_reuse_shifted_edit(edit):
+    old_fp, new_fp, duration = edit
+    prev = {
+        "music_regions": [[2.0, 28.0], [32.0, 48.0], [55.0, 85.0]],
+        "rows": [{"start": 2.0, "end": 28.0, "x": 1}, {"start": 55.0, "end": 85.0, "x": 3}],
+    }
+    reused, changed = plan_reuse(old_fp, prev, new_fp, duration)
+    assert [row["x"] for _, row in reused] == [1, 3]
+    np.testing.assert_allclose([span for span, _ in reused], [(17, 43), (50, 80)], atol=0.05)
+    np.testing.assert_allclose(changed[0], (0, 15), atol=0.5)   # the inserted material
+    assert all(e <= duration for _, e in changed)
+
+
+def test_plan_reuse_drops_rows_of_other_settings(edit):
+    old_fp, new_fp, duration = edit
+    prev = {"music_regions": [[2.0, 28.0]], "rows": [{"start": 2.0, "end": 28.0}],
+            "settings": {"thr": 0.5}}
+    reused, _ = plan_reuse(old_fp, prev, new_fp, duration, settings={"thr": 0.3})
+    assert [row for _, row in reused] == [None]
+    reused, _ = plan_reuse(old_fp, prev, new_fp, duration, settings={"thr": 0.5})
+    assert reused[0][1] is not None
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from sibyllai_core.detectors.segmentation import find_regions, hysteresis, median_smooth
+
+HOP = 0.48
+
+
+def _old_regions(probs, threshold, min_gap):
+    "The frame loop (get_segments + merge_close_segments) find_regions replaced."
+    frame_times = np.arange(len(probs)) * HOP
+    segments, start = [], None
+    for i, flag in enumerate(probs > threshold):
+        if flag and start is None:
+            start = frame_times[i]
+        elif not flag and start is not None:
+            segments.append((start, frame_times[i]))
+            start = None
+    if start is not None:
+        segments.append((start, frame_times[-1] + HOP))
+    if not segments:
+        return []
+    merged = [segments[0]]
+    for start, end in segments[1:]:
+        if start - merged[-1][1] < min_gap:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _old_hysteresis(probs, on, off):
+    out, active = np.zeros(len(probs), dtype=bool), False
+    for i, p in enumerate(probs):
+        active = p > off if active else p > on
+        out[i] = active
+    return out
+
+
+# gaps that are not whole multiples of the hop, where float rounding of
+# frame times could flip a merge decision
+@pytest.mark.parametrize("min_gap", [0.0, 0.5, 1.0, 2.0])
+def test_find_regions_matches_frame_loop(min_gap):
+    rng = np.random.default_rng(0)
+    for n in range(300):
+        probs = rng.random(rng.integers(1, 200)).astype(np.float32)
+        if n % 2:
+            probs = (probs > 0.6).astype(np.float32) * 0.5   # long on/off runs
+        expected = _old_regions(probs, 0.2, min_gap)
+        regions = find_regions(probs, HOP, on=0.2, min_gap=min_gap)
+        assert len(regions) == len(expected)
+        np.testing.assert_allclose(np.reshape(regions, -1), np.reshape(expected, -1), atol=1e-6)
+
+
+def test_find_regions_empty_and_min_duration():
+    assert find_regions(np.zeros(0), HOP) == []
+    probs = np.array([0, 1, 0, 0, 0, 1, 1, 1, 0], dtype=np.float32)
+    assert len(find_regions(probs, HOP, on=0.5)) == 2
+    np.testing.assert_allclose(find_regions(probs, HOP, on=0.5, min_duration=1.0),
+                               [(5 * HOP, 8 * HOP)])
+
+
+def test_hysteresis_matches_loop():
+    rng = np.random.default_rng(1)
+    for _ in range(300):
+        probs = rng.random(rng.integers(1, 100))
+        np.testing.assert_array_equal(hysteresis(probs, 0.7, 0.3),
+                                      _old_hysteresis(probs, 0.7, 0.3))
+
+
+def test_hysteresis_single_threshold():
+    probs = np.array([0.1, 0.6, 0.4, 0.7])
+    np.testing.assert_array_equal(hysteresis(probs, 0.5), probs > 0.5)
+
+
+def test_median_smooth_removes_spikes():
+    probs = np.array([0, 1, 0, 1, 1, 1, 0, 0], dtype=np.float32)
+    np.testing.assert_array_equal(median_smooth(probs, 3), [0, 0, 1, 1, 1, 1, 0, 0])
@@ -0,0 +1,52 @@
+import random
+import time
+
+import pytest
+
+from sibyllai_core.stages import Stage, run_stages
+
+
+def _jitter(x):
+    time.sleep(random.random() * 0.005)   # finish out of order
+    return x
+
+
+STAGES = [
+    Stage("add", lambda x: _jitter(x + 1), workers=2),
+    Stage("drop", lambda x: None if x % 5 == 0 else _jitter(x * 2), workers=3),
+    Stage("sub", lambda x: _jitter(x - 1)),
+]
+
+
+def test_results_in_input_order():
+    threaded = run_stages(range(30), STAGES)
+    assert threaded == run_stages(range(30), STAGES, threaded=False)
+    assert threaded[:6] == [1, 3, 5, 7, None, 11]
+
+
+def test_dropped_items_are_none():
+    results = run_stages(range(30), STAGES)
+    assert [n for n, r in enumerate(results) if r is None] == [4, 9, 14, 19, 24, 29]
+
+
+def test_empty_input():
+    assert run_stages([], STAGES) == []
+
+
+def test_setup_runs_once():
+    calls = []
+    stages = [Stage("a", _jitter, workers=3, setup=lambda: calls.append(1))]
+    run_stages(range(10), stages)
+    assert calls == [1]
+
+
+@pytest.mark.parametrize("threaded", [True, False])
+def test_stage_error_is_raised(threaded):
+    def boom(x):
+        if x == 7:
+            raise RuntimeError("boom")
+        return x
+
+    stages = [Stage("a", _jitter), Stage("b", boom, workers=2), Stage("c", _jitter)]
+    with pytest.raises(RuntimeError, match="boom"):
+        run_stages(range(50), stages, threaded=threaded)
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from sibyllai_core.audio import AudioBuffer
+from sibyllai_core.detectors.yamnet_segmenter import YAMNetSegmenter
+
+HOP, LEN = YAMNetSegmenter.patch_hop, YAMNetSegmenter.patch_len
+
+
+class _Scores:
+    "Minimal tf.Tensor stand-in."
+    def __init__(self, a):
+        self.a, self.shape = a, a.shape
+
+    def numpy(self):
+        return self.a
+
+
+class FakeYAMNet:
+    """
+    Stands in for the hub model: one row per 0.96 s patch hopped by 0.48 s,
+    the tail zero-padded to a whole patch, each score depending on the
+    samples of its own patch only.
+    """
+    def __call__(self, waveform):
+        n = len(waveform)
+        patches = 1 + max(0, -(-(n - LEN) // HOP))
+        y = np.pad(waveform, (0, (patches - 1) * HOP + LEN - n))
+        frames = np.stack([y[k * HOP:k * HOP + LEN] for k in range(patches)])
+        scores = np.zeros((patches, 521), dtype=np.float32)
+        scores[:, 0] = np.abs(frames).mean(1) + frames[:, ::997].sum(1)
+        return _Scores(scores), None, None
+
+
+@pytest.fixture
+def yamnet():
+    seg = YAMNetSegmenter.__new__(YAMNetSegmenter)   # no model / class map loading
+    seg.model_handle, seg._model = "fake", FakeYAMNet()
+    seg.class_names, seg.music_idx = ["Music"], 0
+    return seg
+
+
+@pytest.mark.parametrize("n", [100, 7920, 7921, 15600, 15601, 23281, HOP * 300 + 7920,
+                               HOP * 300 + 7921, 16000 * 100 + 37])
+@pytest.mark.parametrize("block_patches", [5, 7, 256])
+def test_blocks_match_whole_file(yamnet, n, block_patches):
+    rng = np.random.default_rng(n)
+    y = rng.standard_normal(n).astype(np.float32)
+    whole = FakeYAMNet()(y)[0].numpy()
+    blocked = np.concatenate(list(yamnet.iter_scores(AudioBuffer(y[np.newaxis], 16000),
+                                                     block_patches=block_patches)))
+    assert blocked.shape == whole.shape
+    np.testing.assert_allclose(blocked, whole, rtol=1e-5, atol=1e-5)
+
+
+def test_stream_matches_analyse(yamnet):
+    rng = np.random.default_rng(0)
+    y = rng.standard_normal(16000 * 120).astype(np.float32)
+    y *= np.repeat(rng.random(121), 16000)[:len(y)]   # loud and quiet seconds
+    audio = AudioBuffer(y[np.newaxis], 16000)
+    scores = yamnet.scores(audio)
+    thresh = float(np.median(scores[:, 0]))
+    assert (list(yamnet.stream(audio, music_thresh=thresh, block_patches=5))
+            == yamnet.analyse(audio, music_thresh=thresh, scores=scores))